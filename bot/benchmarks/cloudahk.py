@@ -0,0 +1,233 @@
+"""
+Load test for the CloudAHK cog against a local stub backend.
+
+Run from the repository root, the same way as the bot:
+
+    python bot/benchmarks/cloudahk.py -n 500 --latency 0.2 --output 2000
+
+The stub imitates the CloudAHK (`POST /{lang}/run`) and snekbox (`POST /eval`)
+APIs with configurable latency, output size and error rate. Every backend in
+the registry is pointed at it, so nothing leaves the machine.
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import discord  # noqa: E402
+from aiohttp import web  # noqa: E402
+from discord.ext import commands  # noqa: E402
+
+from bot import Bot  # noqa: E402
+from cogs.cloudahk import CloudAHK  # noqa: E402
+from constants import CloudAHKConfig  # noqa: E402
+from utils.backends import Backend, BackendRegistry  # noqa: E402
+from utils.telemetry import percentile  # noqa: E402
+
+
+class StubBackend:
+    """A local HTTP server answering like CloudAHK and snekbox."""
+
+    def __init__(self, latency: float, jitter: float, output: int, error_rate: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.output = output
+        self.error_rate = error_rate
+        self.requests = 0
+        self.app = web.Application()
+        self.app.router.add_get("/", self.probe)
+        self.app.router.add_post("/eval", self.snekbox)
+        self.app.router.add_post("/{lang}/run", self.cloudahk)
+        self.runner = web.AppRunner(self.app)
+        self.url = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+    async def _answer(self, payload: dict) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(max(0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.error_rate:
+            return web.Response(status=500, reason="Stub Error")
+        return web.json_response(payload)
+
+    async def probe(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def cloudahk(self, request: web.Request) -> web.Response:
+        code = await request.text()
+        stdout = (code + "\n") * (self.output // (len(code) + 1) + 1)
+        return await self._answer(
+            {"stdout": stdout[: self.output], "time": self.latency, "language": "ahk"}
+        )
+
+    async def snekbox(self, request: web.Request) -> web.Response:
+        code = (await request.json())["input"]
+        stdout = (code + "\n") * (self.output // (len(code) + 1) + 1)
+        return await self._answer({"stdout": stdout[: self.output], "returncode": 0})
+
+
+class FakeMessage:
+    def __init__(self, content: str):
+        self.id = 0
+        self.content = content
+        self.reference = None
+
+    def to_reference(self, **kwargs):
+        return None
+
+    async def delete(self):
+        pass
+
+
+class FakeChannel:
+    id = 0
+
+    def permissions_for(self, member) -> discord.Permissions:
+        # no reactions, so paged output doesn't start a paginator
+        perms = discord.Permissions.text()
+        perms.add_reactions = False
+        return perms
+
+
+class FakeContext:
+    """Just enough of `commands.Context` for `CloudAHK.cloudahk_call`."""
+
+    def __init__(self, bot: Bot, user_id: int, code: str, stats: Counter):
+        self.bot = bot
+        self.author = discord.Object(user_id)
+        self.author.mention = f"<@{user_id}>"
+        self.me = None
+        self.guild = None
+        self.channel = FakeChannel()
+        self.message = FakeMessage(code)
+        self.stats = stats
+
+    async def send(self, content: str = None, *, files=None, file=None, **kwargs):
+        self.stats["messages"] += 1
+        self.stats["message_chars"] += len(content or "")
+        self.stats["attachments"] += len(files or ()) + (file is not None)
+        return FakeMessage(content)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    stub = StubBackend(args.latency, args.jitter, args.output, args.error_rate)
+    url = await stub.start()
+
+    bot = Bot(command_prefix="=", intents=discord.Intents.none())
+    cog = CloudAHK(bot)
+    cog.backends.stop_health_checks()
+    cog.backends = BackendRegistry(
+        [
+            Backend(name, url, "user", "pass", **_options(options))
+            for name, options in CloudAHKConfig.backends.items()
+        ]
+    )
+    cog.backends.start_health_checks()
+    # keep the audit records of the run out of the real log
+    cog.audit.directory = Path(tempfile.mkdtemp(prefix="cloudahk-bench-"))
+
+    stats = Counter()
+    latencies = []
+    errors = Counter()
+    codes = [f'MsgBox "snippet {i}"' for i in range(args.distinct or args.requests)]
+    lang = "eval" if args.backend == "snekbox" else "ahk"
+
+    async def invoke(i: int) -> None:
+        code = codes[i % len(codes)]
+        ctx = FakeContext(bot, i % args.users, code, stats)
+        start = time.perf_counter()
+        try:
+            await cog.cloudahk_call(
+                ctx, code, lang=lang, version=args.backend, cache=not args.no_cache
+            )
+        except commands.CommandError as e:
+            errors[str(e).split(" (")[0]] += 1
+        else:
+            latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(invoke(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for backend in cog.backends:
+        await backend.close()
+    cog.backends.stop_health_checks()
+    await cog.audit.close()
+    await stub.stop()
+
+    return {
+        "requests": args.requests,
+        "succeeded": len(latencies),
+        "errors": dict(errors),
+        "backend_requests": stub.requests,
+        "cache": cog.result_cache.stats(),
+        "coalesced": cog.inflight.coalesced,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "peak_traced_mb": peak / 2**20,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "messages": dict(stats),
+    }
+
+
+def _options(options: dict) -> dict:
+    options = dict(options)
+    options.pop("config")
+    return options
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20, help="distinct invokers")
+    parser.add_argument(
+        "--distinct",
+        type=int,
+        default=0,
+        help="distinct snippets, repeated across requests (0: all distinct)",
+    )
+    parser.add_argument("--backend", default="stable")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="seconds")
+    parser.add_argument("--output", type=int, default=200, help="stdout characters")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="print the report as json")
+    args = parser.parse_args()
+
+    report = asyncio.get_event_loop().run_until_complete(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key, value in report.items():
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        print(f"{key:<18} {value}")
+
+
+if __name__ == "__main__":
+    main()
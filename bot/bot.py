@@ -1,17 +1,21 @@
 #! /opt/python-3.9.2/bin/python3.9
 
 import asyncio
+import atexit
+import importlib
 import logging
-
-# import logging.handlers
+import logging.handlers
+import math
 import os
+import queue
 import socket
 import sys
+import time
 import warnings
 from collections import defaultdict
 from contextlib import suppress
 from os import getenv
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 
 import aiohttp
 import asyncpraw
@@ -19,7 +23,15 @@ import coloredlogs
 import discord
 import verboselogs
 from discord.ext import commands
+from constants import Client, Logging, Metrics
 from dotenv import load_dotenv
+from utils.assets import AssetCache
+from utils.command_stats import CommandStats, TimedContext
+from utils.git import GitState
+from utils.metrics import HttpMetrics, Registry
+from utils.metrics_server import MetricsServer
+from utils.startup import StartupProfile
+from utils.telemetry import LatencyMonitor
 
 from config import DESCRIPTION, LOG_LEVEL, TOKEN
 
@@ -27,15 +39,39 @@ EXTENSIONS = (
     "cogs.owner.admin",
     "cogs.cloudahk",
     "cogs.meta",
+    "cogs.feed",
     "utils.error_handling",
 )
 
 
-def setup_logger():  # -> logging.getLogger:
-    # init first log file
-    # if not os.path.isfile('logs/log.log'):
-    #    open('logs/log.log', 'w+')
+def build_intents(profile: str, extensions: Iterable[str]) -> discord.Intents:
+    """The intents for a profile from `constants.Client.intents`."""
+    if profile == "all":
+        return discord.Intents.all()
+    if profile == "default":
+        return discord.Intents.default()
+    if profile != "lean":
+        raise ValueError(f"Unknown intents profile {profile!r}")
+    # the cache of discord.py doesn't work without guilds
+    intents = discord.Intents(guilds=True)
+    for extension in extensions:
+        module = importlib.import_module(extension)
+        for name in getattr(module, "REQUIRED_INTENTS", ()):
+            setattr(intents, name, True)
+    return intents
+
 
+def build_member_cache(
+    policy: str, intents: discord.Intents
+) -> discord.MemberCacheFlags:
+    if policy == "none":
+        return discord.MemberCacheFlags.none()
+    if policy != "intents":
+        raise ValueError(f"Unknown member cache policy {policy!r}")
+    return discord.MemberCacheFlags.from_intents(intents)
+
+
+def setup_logger():  # -> logging.getLogger:
     verboselogs.install()
     log: verboselogs.VerboseLogger = logging.getLogger(__name__)
     # set logging levels for various libs
@@ -46,38 +82,39 @@ def setup_logger():  # -> logging.getLogger:
     logging.getLogger("aiotrace").setLevel(logging.INFO)
 
     # we want our logging formatted like this everywhere
-    # fmt = logging.Formatter(
-    #     "{asctime} [{levelname}] {name}: {message}",
-    #     datefmt="%Y-%m-%d %H:%M:%S",
-    #     style="{",
-    # )
-    coloredlogs.install(
-        level=verboselogs.SPAM, fmt="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
-    )
-    log.success("Logger Configured.")
-    # log.setFormatter(fmt)
-    # stream = ColorStreamHandler(sys.stdout)
-    # stream.setFormatter(fmt)
-    # stream.setLevel(logging.DEBUG)
-
-    # file = logging.handlers.TimedRotatingFileHandler(
-    #     'logs/log.log', when='midnight', encoding='utf-8-sig')
-    # file.setFormatter(fmt)
-    # file.setLevel(logging.INFO)
-
-    # get the __main__ log and add handlers
+    fmt = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+    coloredlogs.install(level=LOG_LEVEL, fmt=fmt)
     root = logging.getLogger()
+    # records below the level are dropped by the logger before being formatted
     root.setLevel(LOG_LEVEL)
-    # root.addHandler(file)
-    return log
 
-    logging.basicConfig(
-        level=LOG_LEVEL,
-        format="{asctime} [{levelname}] {name}: {message}",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        style="{",
+    handlers = list(root.handlers)
+    if Logging.file:
+        os.makedirs(os.path.dirname(Logging.file) or ".", exist_ok=True)
+        file = logging.handlers.TimedRotatingFileHandler(
+            Logging.file,
+            when="midnight",
+            backupCount=Logging.backups,
+            encoding="utf-8-sig",
+        )
+        file.setFormatter(logging.Formatter(fmt))
+        file.setLevel(Logging.file_level)
+        handlers.append(file)
+
+    # handlers write to the terminal and file from a thread of their own, so
+    # slow output never holds up the event loop
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
     )
-    return logging.getLogger(__name__)
+    listener.start()
+    atexit.register(listener.stop)
+
+    log.success("Logger Configured.")
+    return log
 
 
 class Bot(commands.AutoShardedBot):
@@ -86,45 +123,145 @@ class Bot(commands.AutoShardedBot):
     # http_session: aiohttp.ClientSession
 
     def __init__(self, *args, **kwargs):
+        self.startup = StartupProfile()
         super().__init__(*args, **kwargs)
         self.http_session: Optional[aiohttp.ClientSession] = None
+        self.trace_configs: List[aiohttp.TraceConfig] = []
         self.closing_tasks: List[asyncio.Task] = []
+        self.git = GitState()
+        self.assets = AssetCache(self)
+        self.latency_monitor = LatencyMonitor(self)
+        self.http_metrics = HttpMetrics(log_sample=Metrics.http_log_sample)
+        self.metrics = Registry()
+        self._register_metrics()
+        self.command_stats = CommandStats(
+            self.metrics, Metrics.slow_command, Metrics.slow_log_size
+        )
+        self.before_invoke(self.command_stats.before_invoke)
+        self.metrics_server: Optional[MetricsServer] = None
+        if Metrics.port:
+            self.metrics_server = MetricsServer(
+                self.metrics, Metrics.host, Metrics.port
+            )
         self.invite_link = "https://discord.com/api/oauth2/authorize?client_id={}&permissions=379968&scope=bot"
 
-    async def create_http_pool(self) -> None:
-        aiohttp_log: verboselogs.VerboseLogger = logging.getLogger("aiotrace")
-
-        async def on_request_end(self, session, end):
-            resp = end.response
-            aiohttp_log.info(
-                "[%s %s] %s %s (%s)",
-                str(resp.status),
-                resp.reason,
-                end.method.upper(),
-                end.url,
-                resp.content_type,
-            )
+    def _register_metrics(self) -> None:
+        self.metrics.counter("commands_total", "Commands invoked, by outcome.")
+        self.metrics.histogram("command_seconds", "Time taken by each command.")
+        self.metrics.counter("gateway_events_total", "Gateway events received.")
+        self.metrics.gauge(
+            "shard_latency_seconds",
+            "Heartbeat latency of each shard.",
+            lambda: (
+                ((("shard", shard_id),), latency)
+                for shard_id, latency in self.latencies
+                if math.isfinite(latency)
+            ),
+        )
+        self.metrics.collect(
+            "event_loop_lag_seconds",
+            "How late the event loop woke up a sleeping task.",
+            "histogram",
+            lambda: (((), self.latency_monitor.loop_lag),),
+        )
+        self.metrics.gauge(
+            "cache_entries",
+            "Objects in the caches of discord.py.",
+            # the public properties copy each cache into a list, so the
+            # dicts behind them are counted instead
+            lambda: (
+                ((("cache", "guilds"),), len(self._connection._guilds)),
+                ((("cache", "users"),), len(self._connection._users)),
+                ((("cache", "messages"),), len(self.cached_messages)),
+                (
+                    (("cache", "members"),),
+                    sum(
+                        len(guild._members)
+                        for guild in self._connection._guilds.values()
+                    ),
+                ),
+            ),
+        )
+        self.http_metrics.register(self.metrics)
 
-        trace_config = aiohttp.TraceConfig()
-        trace_config.on_request_end.append(on_request_end)
+    async def create_http_pool(self) -> None:
+        # shared with the sessions cogs create for themselves
+        self.trace_configs.append(self.http_metrics.trace_config())
 
         log.info("setting up http")
         self.http_session = aiohttp.ClientSession(
             timeout=aiohttp.ClientTimeout(total=5),
-            trace_configs=[trace_config],
+            trace_configs=self.trace_configs,
         )
         log.debug(self.http_session)
         log.info("http set up")
+        self.startup.mark("http pool")
+
+    def load_extension(self, name: str) -> None:
+        # reload_extension loads through here too, so reloads are dispatched once
+        super().load_extension(name)
+        self.dispatch("extension_load", name)
+
+    def unload_extension(self, name: str) -> None:
+        super().unload_extension(name)
+        self.dispatch("extension_unload", name)
+
+    def _load_from_module_spec(self, spec, key) -> None:
+        # time importing the module apart from running its setup
+        timing = {"import": 0.0}
+        exec_module = spec.loader.exec_module
+
+        def timed_exec_module(module):
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                timing["import"] = time.perf_counter() - start
+
+        spec.loader.exec_module = timed_exec_module
+        start = time.perf_counter()
+        super()._load_from_module_spec(spec, key)
+        timing["setup"] = time.perf_counter() - start - timing["import"]
+        self.startup.extensions[key] = timing
+        self.startup.failed.pop(key, None)
 
     def load_extensions(self) -> None:
         """Load all enabled extensions."""
         for extension in EXTENSIONS:
             try:
                 self.load_extension(extension)
-            except Exception:
-                log.error(f"Unable to load {extension}.")
-            log.success(f"Cog loaded: {extension}.")
+            except Exception as e:
+                self.startup.failed[extension] = repr(e.__cause__ or e)
+                log.exception("Unable to load %s.", extension)
+            else:
+                log.success("Cog loaded: %s.", extension)
         log.info("Extensions loaded!")
+        self.startup.mark("extensions")
+
+    def add_cog(self, cog: commands.Cog) -> None:
+        super().add_cog(cog)
+        # cogs added before ready are set up by on_ready
+        if "ready" in self.startup.marks and hasattr(cog, "deferred_setup"):
+            self.loop.create_task(self._deferred_setup(cog))
+
+    async def _deferred_setup(self, cog: commands.Cog) -> None:
+        """Run the setup `cog` put off until the bot is connected."""
+        start = time.perf_counter()
+        try:
+            await cog.deferred_setup()
+        except Exception:
+            log.exception("Deferred setup of %s failed.", cog.qualified_name)
+        self.startup.deferred[cog.qualified_name] = time.perf_counter() - start
+
+    async def login(self, *args, **kwargs) -> None:
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        await super().login(*args, **kwargs)
+        self.startup.mark("login")
+
+    async def connect(self, *args, **kwargs) -> None:
+        self.startup.mark("connect")
+        await super().connect(*args, **kwargs)
 
     async def close(self) -> None:
         """Close the Discord connection and the aiohttp session"""
@@ -146,6 +283,10 @@ class Bot(commands.AutoShardedBot):
         log.info("Waiting for tasks before closing.")
 
         await asyncio.gather(*self.closing_tasks)
+        self.git.stop()
+        self.latency_monitor.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
 
         if self.http_session:
             await self.http_session.close()
@@ -163,11 +304,62 @@ class Bot(commands.AutoShardedBot):
 
     async def on_ready(self):
         log.info("Ready! %s", self.user)
+        self.git.start()
+        self.latency_monitor.start()
+
+        if "ready" in self.startup.marks:
+            return
+        self.startup.mark("ready")
+        await asyncio.gather(
+            *(
+                self._deferred_setup(cog)
+                for cog in list(self.cogs.values())
+                if hasattr(cog, "deferred_setup")
+            )
+        )
+        self.startup.mark("deferred setup")
+        log.info("Startup profile:\n%s", self.startup.report())
+
+    async def get_context(self, message: discord.Message, *, cls=TimedContext):
+        return await super().get_context(message, cls=cls)
+
+    async def invoke(self, ctx: commands.Context) -> None:
+        if ctx.command is None:
+            return await super().invoke(ctx)
+        start = time.perf_counter()
+        try:
+            await super().invoke(ctx)
+        finally:
+            # this runs for failed checks, conversions and callbacks too
+            seconds = time.perf_counter() - start
+            labels = (("command", ctx.command.qualified_name),)
+            self.metrics.observe("command_seconds", seconds, labels)
+            outcome = "error" if ctx.command_failed else "ok"
+            self.metrics.inc("commands_total", labels + (("outcome", outcome),))
+            self.command_stats.record(ctx, seconds)
+
+    def dispatch(self, event_name: str, *args, **kwargs) -> None:
+        # counted here rather than in a listener, which would mean a task
+        # for every frame the gateway sends
+        if event_name == "socket_response":
+            msg = args[0]
+            event = msg.get("t") or f"op {msg.get('op')}"
+            self.metrics.inc("gateway_events_total", (("event", event),))
+        super().dispatch(event_name, *args, **kwargs)
+
+    async def on_user_update(self, before: discord.User, after: discord.User):
+        if after.id == self.user.id:
+            self.assets.invalidate()
 
 
 if __name__ == "__main__":
     log = setup_logger()
-    intents = discord.Intents.all()
+    intents = build_intents(Client.intents, EXTENSIONS)
+    log.info(
+        "Intents profile %s: %s",
+        Client.intents,
+        ", ".join(name for name, on in intents if on),
+    )
     allowed_mentions = discord.AllowedMentions(
         everyone=False,
         users=True,
@@ -179,6 +371,8 @@ if __name__ == "__main__":
         description=DESCRIPTION,
         allowed_mentions=allowed_mentions,
         intents=intents,
+        member_cache_flags=build_member_cache(Client.member_cache, intents),
+        chunk_guilds_at_startup=Client.chunk_guilds and intents.members,
     )
     loop = asyncio.get_event_loop()
     loop.run_until_complete(bot.create_http_pool())
@@ -1,38 +1,95 @@
 import asyncio
-import base64
+import hashlib
+import inspect
 import io
+import json
 import logging
 import re
-from base64 import b64encode
+from contextlib import suppress
 from discord.ext.commands import MissingRequiredArgument
 from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Tuple
 
+import aiohttp
 import discord
 import verboselogs
 from bot import Bot
-from config import (
-    CLOUDAHK_PASS,
-    CLOUDAHK_PASS_BETA,
-    CLOUDAHK_PASS_DEV,
-    CLOUDAHK_URL,
-    CLOUDAHK_URL_BETA,
-    CLOUDAHK_URL_DEV,
-    CLOUDAHK_USER,
-    CLOUDAHK_USER_BETA,
-    CLOUDAHK_USER_DEV,
-    SNEKBOX_PASS_DEV,
-    SNEKBOX_URL_DEV,
-    SNEKBOX_USER_DEV,
-)
+from constants import Audit, CloudAHKConfig
 from discord.ext import commands
+from utils.audit import AuditLog
+from utils.backends import Backend, BackendRegistry, BackendUnavailable
+from utils.cache import LRUCache
+from utils.command_stats import TimedContext
+from utils.concurrency import QueueFull, SingleFlight
+from utils.docs_index import DocsIndex
+from utils.file import DISCORD_UPLOAD_LIMIT, decode_png, split_png
+from utils.http import read_capped
+from utils.render import send_output
 
 log: verboselogs.VerboseLogger = logging.getLogger(__name__)
 
+# commands come in messages, and long output is paged with reactions
+REQUIRED_INTENTS = ("messages", "reactions")
+
 AHK_COLOR = 0x95CD95
-RSS_URL = "https://www.autohotkey.com/boards/feed"
 
 DOCS_FORMAT = "https://autohotkey.com/docs/{}"
 
+# code using any of these won't produce the same output twice, so it is never cached.
+# a DllCall can read anything from the system, so it counts too
+NONDETERMINISTIC_RE = re.compile(
+    r"\b(?:random|A_Now(?:UTC)?|A_TickCount|A_(?:YYYY|Year|MM|Mon|DD|MDay|WDay|YDay)"
+    r"|A_(?:Hour|Min|Sec|MSec|TimeIdle\w*)|FormatTime|GetTickCount\w*|DllCall"
+    r"|QueryPerformanceCounter|UrlDownloadToFile"
+    r"|Download|WinHttp|ComObj\w*|time|datetime|uuid|secrets|urandom)\b",
+    re.IGNORECASE,
+)
+
+DURATION_RE = re.compile(r"(\d+)([smhdw])")
+DURATION_UNITS = {
+    "s": 1,
+    "m": 60,
+    "h": 60 * 60,
+    "d": 60 * 60 * 24,
+    "w": 60 * 60 * 24 * 7,
+}
+
+# a fenced code block, with or without a language; an unclosed fence runs to the end
+CODE_BLOCK_RE = re.compile(
+    r"```(?:(?P<lang>[\w+#.-]*)[ \t]*\n)?(?P<code>.*?)(?:```|\Z)", re.DOTALL
+)
+
+STDOUT_START_RE = re.compile(r'"stdout"\s*:\s*"')
+# the body of a json string, up to its closing quote or the end of the data
+JSON_STRING_BODY_RE = re.compile(r'(?:[^"\\]|\\.)*', re.DOTALL)
+
+
+def partial_stdout(body: bytes) -> str:
+    """Recover as much of stdout as possible from a cut short CloudAHK response."""
+    text = body.decode("utf-8", errors="ignore")
+    start = STDOUT_START_RE.search(text)
+    if start is None:
+        return ""
+    raw = JSON_STRING_BODY_RE.match(text, start.end()).group()
+    # the cut may have landed inside a \uXXXX escape
+    for end in range(len(raw), max(len(raw) - 6, -1), -1):
+        try:
+            stdout = json.loads(f'"{raw[:end]}"')
+        except ValueError:
+            continue
+        break
+    else:
+        return ""
+    # or between the halves of a surrogate pair
+    if stdout and "\ud800" <= stdout[-1] <= "\udbff":
+        stdout = stdout[:-1]
+    return stdout
+
+
+# what a missing code argument is reported as; the error reads its name
+CODE_PARAM = inspect.Parameter("code", inspect.Parameter.KEYWORD_ONLY)
+
 
 class RunnableCodeConverter(commands.Converter):
     async def convert(self, ctx: commands.Context, code=None):
@@ -42,16 +99,11 @@ class RunnableCodeConverter(commands.Converter):
                     code: str = ctx.message.reference.resolved.content
                     code = code[code.find(r"`") or 0 :]
                 except Exception:
-                    raise MissingRequiredArgument("code")
+                    raise MissingRequiredArgument(CODE_PARAM)
             else:
-                raise MissingRequiredArgument("code")
+                raise MissingRequiredArgument(CODE_PARAM)
         elif code.startswith("https://p.ahkscript.org/"):
-            url = code.replace("?p=", "?r=")
-            async with self.bot.http_session.get(url) as resp:
-                if resp.status == 200 and str(resp.url) == url:
-                    code = await resp.text()
-                else:
-                    raise commands.CommandError("Failed fetching code from pastebin.")
+            code = await ctx.bot.get_cog("CloudAHK").fetch_paste(code)
 
         return code
 
@@ -61,125 +113,441 @@ class CloudAHK(commands.Cog):
 
     def __init__(self, bot: Bot):
         self.bot = bot
+        self.result_cache = LRUCache(
+            maxsize=CloudAHKConfig.cache_size, ttl=CloudAHKConfig.cache_ttl
+        )
+        # pastes never change once made, so they only need to be fetched once
+        self.paste_cache = LRUCache(maxsize=CloudAHKConfig.paste_cache_size)
+        # identical submissions made at the same time share one backend call
+        self.inflight = SingleFlight()
+        self.backends = BackendRegistry.from_config(self.bot.trace_configs)
+        self.backends.start_health_checks()
+        # loaded by deferred_setup
+        self.docs: Optional[DocsIndex] = None
+        self.audit = AuditLog(
+            Audit.directory,
+            max_bytes=Audit.max_bytes,
+            flush_interval=Audit.flush_interval,
+            max_pending=Audit.max_pending,
+        )
+        self.audit.start()
+        self._register_metrics()
 
-    def parse_date(self, date_str):
-        date_str = date_str.strip()
-        return datetime.strptime(date_str[:-3] + date_str[-2:], "%Y-%m-%dT%H:%M:%S%z")
-
-    async def cloudahk_call(
-        self,
-        ctx: commands.Context,
-        code: str,
-        lang="ahk",
-        version="stable",
-        img: bool = False,
-    ):
-        """Call to CloudAHK to run %code% written in %lang%. Replies to invoking user with stdout/runtime of code. """
-
-        log.debug(f"Running cloudahk: {version} version")
+    def _register_metrics(self) -> None:
+        metrics = self.bot.metrics
+        metrics.counter(
+            "cloudahk_requests_total", "CloudAHK runs, by backend and outcome."
+        )
+        metrics.histogram("cloudahk_request_seconds", "CloudAHK run time, by backend.")
+        metrics.gauge(
+            "cloudahk_queue",
+            "CloudAHK runs running and queued, by backend.",
+            lambda: (
+                ((("backend", backend.name), ("state", state)), value)
+                for backend in self.backends
+                for state, value in (
+                    ("running", backend.scheduler.running),
+                    ("queued", backend.scheduler.queued),
+                )
+            ),
+        )
+        metrics.gauge(
+            "cloudahk_cache_entries",
+            "Entries in the CloudAHK caches.",
+            lambda: (
+                ((("cache", "results"),), len(self.result_cache)),
+                ((("cache", "pastes"),), len(self.paste_cache)),
+            ),
+        )
 
-        if version == "dev":
-            url, user, passwd = CLOUDAHK_URL_DEV, CLOUDAHK_USER_DEV, CLOUDAHK_PASS_DEV
-        elif version == "beta":
-            url, user, passwd = (
-                CLOUDAHK_URL_BETA,
-                CLOUDAHK_USER_BETA,
-                CLOUDAHK_PASS_BETA,
+    def cog_unload(self):
+        # the gauges read this cog, so they go with it
+        self.bot.metrics.remove("cloudahk_queue")
+        self.bot.metrics.remove("cloudahk_cache_entries")
+        self.backends.stop_health_checks()
+        self.bot.closing_tasks.append(asyncio.ensure_future(self.audit.close()))
+        # let queued requests finish before the bot closes
+        for backend in self.backends:
+            self.bot.closing_tasks.append(
+                asyncio.ensure_future(backend.close(CloudAHKConfig.drain_timeout))
             )
-        elif version == "snekbox":
-            url, user, passwd = (SNEKBOX_URL_DEV, SNEKBOX_USER_DEV, SNEKBOX_PASS_DEV)
-        else:
-            url, user, passwd = (CLOUDAHK_URL, CLOUDAHK_USER, CLOUDAHK_PASS)
 
-        token = "{0}:{1}".format(user, passwd)
+    async def deferred_setup(self):
+        self.docs = await self.bot.loop.run_in_executor(None, self.load_docs_index)
+
+    @staticmethod
+    def load_docs_index() -> Optional[DocsIndex]:
+        path = Path(CloudAHKConfig.docs_index_path)
+        try:
+            docs = DocsIndex.load(path)
+        except (OSError, ValueError) as e:
+            log.warning("AutoHotkey docs index not loaded: %s", e)
+            return None
+        log.info("Loaded %d AutoHotkey docs entries from %s", len(docs), path)
+        return docs
 
-        encoded = b64encode(bytes(token, "utf-8")).decode("utf-8")
-        headers = {"Authorization": "Basic " + encoded}
+    def parse_date(self, date_str):
+        date_str = date_str.strip()
+        return datetime.strptime(date_str[:-3] + date_str[-2:], "%Y-%m-%dT%H:%M:%S%z")
 
-        # remove first line with backticks and highlighting lang
-        if re.match("^```.*\n", code):
-            code = code[code.find("\n") + 1 :]
+    async def fetch_paste(self, url: str) -> str:
+        """Get the raw code of a p.ahkscript.org paste."""
+        url = url.replace("?p=", "?r=")
+        code = self.paste_cache.get(url)
+        if code is not None:
+            return code
+
+        async with self.bot.http_session.get(url) as resp:
+            if resp.status != 200 or str(resp.url) != url:
+                raise commands.CommandError("Failed fetching code from pastebin.")
+            body, truncated = await read_capped(resp, CloudAHKConfig.max_paste_bytes)
+            encoding = resp.charset or "utf-8"
+
+        if truncated:
+            raise commands.CommandError(
+                f"Paste is larger than {CloudAHKConfig.max_paste_bytes} bytes."
+            )
+        code = body.decode(encoding, errors="replace")
+        self.paste_cache.set(url, code)
+        return code
 
-        # strip backticks on both sides
-        code = code.strip("`").strip()
+    @staticmethod
+    def clean_code(code: str) -> str:
+        """Take the code out of the first code block in %code%, or strip inline backticks."""
+        match = CODE_BLOCK_RE.search(code)
+        if match is not None:
+            return match.group("code").strip()
+        return code.strip("`").strip()
+
+    @staticmethod
+    def code_blocks(text: str) -> List[str]:
+        """Every non-empty fenced code block in %text%, in one pass."""
+        return [
+            code
+            for code in (m.group("code").strip() for m in CODE_BLOCK_RE.finditer(text))
+            if code
+        ]
+
+    @staticmethod
+    def cache_key(code: str, lang: str, version: str) -> Tuple[str, str, str]:
+        normalized = code.replace("\r\n", "\n").replace("\r", "\n")
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return version, lang, digest
+
+    def get_backend(self, version: str) -> Backend:
+        try:
+            return self.backends[version]
+        except KeyError:
+            raise commands.CommandError(
+                f"CloudAHK backend `{version}` isn't configured."
+            )
 
-        # call cloudahk with 20 in timeout
-        if version != "snekbox":
-            async with self.bot.http_session.post(
-                "{0}/{1}{2}".format(url, lang, "/run" if version != "snekbox" else ""),
-                data=code,
-                headers=headers,
-                timeout=20,
+    async def _cloudahk_request(self, backend: Backend, code: str, lang: str) -> dict:
+        """Run %code% on %backend% and return the normalized result."""
+        labels = (("backend", backend.name),)
+        down = labels + (("outcome", "down"),)
+        start = self.bot.loop.time()
+        try:
+            async with backend.session.post(
+                backend.run_url(lang), **backend.payload(code)
             ) as resp:
-                if resp.status == 200:
-                    result = await resp.json()
-                else:
+                if resp.status >= 500:
+                    raise BackendUnavailable(f"{resp.status} {resp.reason}")
+                if resp.status != 200:
                     raise commands.CommandError(f"{resp.status}. Something went wrong.")
-        else:
-            payload = {"input": code}
-            async with self.bot.http_session.post(
-                f"{url}/eval", json=payload, headers=headers, timeout=20
-            ) as resp:
-                if resp.status == 200:
-                    result = await resp.json()
-                else:
-                    raise commands.CommandError("Something went wrong.")
-
-        stdout = result["stdout"].strip()
+                # a runaway script can print far more than we could ever send,
+                # so stop reading once the output can't fit in an upload anyway
+                body, truncated = await read_capped(
+                    resp, CloudAHKConfig.max_response_bytes
+                )
+        except BackendUnavailable:
+            self.bot.metrics.inc("cloudahk_requests_total", down)
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.bot.metrics.inc("cloudahk_requests_total", down)
+            raise BackendUnavailable(e.__class__.__name__) from e
+        self.bot.metrics.observe(
+            "cloudahk_request_seconds", self.bot.loop.time() - start, labels
+        )
+        self.bot.metrics.inc(
+            "cloudahk_requests_total",
+            labels + (("outcome", "truncated" if truncated else "ok"),),
+        )
 
+        if truncated:
+            log.info(
+                "CloudAHK %s output truncated at %d bytes", backend.name, len(body)
+            )
+            return {
+                "stdout": "{}\n[truncated at {} bytes]".format(
+                    partial_stdout(body).strip(), len(body)
+                ),
+                "time": None,
+                "language": lang,
+                "backend": backend.name,
+                "truncated": True,
+            }
+
+        result = json.loads(body)
         try:
             time = result["time"]
         except KeyError:
             time = result["returncode"]
 
+        return {
+            "stdout": result["stdout"].strip(),
+            "time": time,
+            "language": result.get("language", lang),
+            "backend": backend.name,
+        }
+
+    async def _scheduled_request(
+        self,
+        ctx: commands.Context,
+        backend: Backend,
+        code: str,
+        lang: str,
+        notify: bool = True,
+    ) -> dict:
+        """Queue a request on %backend%'s scheduler, telling the user if they have to wait."""
         try:
-            language = result["language"]
-        except KeyError:
-            language = lang
+            fut, position = backend.scheduler.submit(
+                ctx.author.id, lambda: self._cloudahk_request(backend, code, lang)
+            )
+        except QueueFull as e:
+            raise commands.CommandError(str(e))
 
-        file1 = None
-        encoded_stdout = stdout.encode("utf-8")
+        if not position or not notify:
+            return await fut
 
+        notice = await ctx.send(
+            f"Queued for `{backend.name}` at position {position}.",
+            reference=ctx.message.to_reference(fail_if_not_exists=False),
+        )
+        try:
+            return await fut
+        finally:
+            with suppress(discord.HTTPException):
+                await notice.delete()
+
+    async def _queued_request(
+        self,
+        ctx: commands.Context,
+        code: str,
+        lang: str,
+        version: str,
+        failover: bool = True,
+        notify: bool = True,
+    ) -> dict:
+        """Run %code% on %version%, moving on to its failover backends if it is down."""
+        self.get_backend(version)
+        error = None
+        for backend in self.backends.route(version, failover):
+            try:
+                result = await self._scheduled_request(ctx, backend, code, lang, notify)
+            except BackendUnavailable as e:
+                log.warning("CloudAHK backend %s unavailable: %s", backend.name, e)
+                backend.record_error(str(e))
+                error = e
+            else:
+                backend.record_success()
+                return result
+
+        raise commands.CommandError(
+            f"CloudAHK `{version}` is unavailable right now ({error}). Try again later."
+        )
+
+    async def run_code(
+        self,
+        ctx: commands.Context,
+        code: str,
+        lang: str = "ahk",
+        version: str = "stable",
+        cache: bool = True,
+        failover: bool = True,
+        notify: bool = True,
+    ) -> dict:
+        """Get the result of running %code%, from the cache or from the backend."""
+        # `cache=False` asks for a run of its own, so don't join one in flight either
+        share = cache
+        # code that reads the clock, rng, or network won't give the same output twice
+        cache = cache and NONDETERMINISTIC_RE.search(code) is None
+        key = self.cache_key(code, lang, version)
+
+        result = self.result_cache.get(key) if cache else None
+        if result is not None:
+            log.debug("cloudahk cache hit: %s %s", version, lang)
+            self._audit(ctx, code, lang, result, cached=True)
+            return result
+
+        def request():
+            return self._queued_request(ctx, code, lang, version, failover, notify)
+
+        start = self.bot.loop.time()
+        result = await (self.inflight.run(key, request) if share else request())
+        if isinstance(ctx, TimedContext):
+            ctx.timings["backend"] += self.bot.loop.time() - start
+        # a failover result would outlive the outage under the requested variant
         if (
-            len(stdout) < (1800 - stdout.count("```") * 4 / 3)
-            and stdout.count("\n") < 20
-            and stdout.count("\r") < 20
+            cache
+            and result["backend"] == version
+            and result["time"] is not None
+            and len(result["stdout"]) <= CloudAHKConfig.cache_max_output
         ):
-            # upload as plaintext
-            stdout = stdout.replace("```", "`\u200b``")
-            valid_response = (
-                " `No Output.`\n"
-                if stdout == ""
-                else "\n```{1}\n{0}\n```".format(stdout, language)
+            self.result_cache.set(key, result)
+        self._audit(ctx, code, lang, result, cached=False)
+        return result
+
+    def _audit(
+        self, ctx: commands.Context, code: str, lang: str, result: dict, cached: bool
+    ) -> None:
+        self.audit.record(
+            user=ctx.author.id,
+            guild=ctx.guild.id if ctx.guild else None,
+            channel=ctx.channel.id,
+            message=ctx.message.id,
+            backend=result["backend"],
+            lang=lang,
+            code=code[: Audit.max_code],
+            time=result["time"],
+            stdout=result["stdout"][: Audit.max_stdout],
+            cached=cached,
+        )
+
+    @staticmethod
+    async def _code_or_reply(ctx: commands.Context, code: Optional[str]) -> str:
+        """Return %code%, or the code of the message being replied to if there is none."""
+        if code is None:
+            # the converter isn't called for a missing argument, but it knows
+            # how to take the code from the message this replies to
+            code = await RunnableCodeConverter().convert(ctx, None)
+        return code
+
+    async def cloudahk_call(
+        self,
+        ctx: commands.Context,
+        code: str,
+        lang="ahk",
+        version="stable",
+        img: bool = False,
+        cache: bool = True,
+        failover: bool = True,
+    ):
+        """Call to CloudAHK to run %code% written in %lang%. Replies to invoking user with stdout/runtime of code."""
+
+        log.debug("Running cloudahk: %s version", version)
+
+        code = self.clean_code(await self._code_or_reply(ctx, code))
+        result = await self.run_code(ctx, code, lang, version, cache, failover)
+        return await self._send_result(ctx, result, version, img)
+
+    async def cloudahk_batch(
+        self, ctx: commands.Context, text: str, lang="ahk", version="stable"
+    ):
+        """Run every code block in %text% at once and reply with all of their output together."""
+        blocks = self.code_blocks(await self._code_or_reply(ctx, text))
+        if not blocks:
+            raise commands.CommandError("No code blocks found.")
+        if len(blocks) > CloudAHKConfig.max_batch:
+            raise commands.CommandError(
+                f"At most {CloudAHKConfig.max_batch} code blocks can be run at once."
             )
 
-        elif len(encoded_stdout) < (800000):  # limited to 8mb
+        # they go through the backend's scheduler like any other request, one
+        # "queued" notice per block would just be noise though
+        results = await asyncio.gather(
+            *(
+                self.run_code(ctx, block, lang, version, notify=False)
+                for block in blocks
+            ),
+            return_exceptions=True,
+        )
 
-            if img:  # png
-                file_name = "img.png"
-                fp = io.BytesIO(base64.b64decode(stdout.encode("ascii")))
-                # file2 = discord.File(fp, file_name)
-            fp = io.BytesIO(encoded_stdout)
-            file_name = "results.txt"
-            file1 = discord.File(fp, file_name)
-            valid_response = " Results too large. See attached file(s).\n"
+        sections = []
+        backends = set()
+        total = 0.0
+        # every block gets an equal share of one attachment, should it come to that
+        section_bytes = (DISCORD_UPLOAD_LIMIT - 1024) // len(blocks)
+        for i, result in enumerate(results, start=1):
+            if isinstance(result, commands.CommandError):
+                sections.append(f"── Block {i}: failed ──\n{result}")
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            backends.add(result.get("backend", version))
+            time = result["time"]
+            total += time or 0
+            stdout = result["stdout"] or "No Output."
+            encoded = stdout.encode("utf-8")
+            if len(encoded) > section_bytes:
+                stdout = "{}\n[truncated at {} bytes]".format(
+                    encoded[:section_bytes].decode("utf-8", "ignore"), section_bytes
+                )
+            sections.append(
+                "── Block {} · {} ──\n{}".format(
+                    i, "timed out" if time is None else f"{time:.1f}s", stdout
+                )
+            )
 
-        else:
-            raise commands.CommandError("Output greater than 8mb.")
-
-        out = "{}{}{}{}\n{}".format(
-            ctx.author.mention,
-            f"\nLanguage: `{language}`",
-            valid_response,
-            "`Processing time: {}`".format(
-                "Timed out" if time is None else "{0:.1f} seconds".format(time)
+        await send_output(
+            ctx,
+            "\n\n".join(sections),
+            prefix=f"{ctx.author.mention}\nLanguage: `{lang}` · {len(blocks)} blocks\n",
+            suffix=(
+                f"\n`Total processing time: {total:.1f} seconds`"
+                "\n*CloudAHK Backend Variant: `{}`*".format(
+                    "`, `".join(sorted(backends)) or version
+                )
             ),
-            f"*CloudAHK Backend Variant: `{version}`*",
+            reference=ctx.message.to_reference(fail_if_not_exists=False),
         )
 
-        await ctx.send(
-            content=out,
-            files=file1,
+    async def _send_result(
+        self, ctx: commands.Context, result: dict, version: str, img: bool = False
+    ):
+        """Reply to the invoking user with a result from CloudAHK."""
+        stdout = result["stdout"]
+        time = result["time"]
+        language = result["language"]
+        backend = result.get("backend", version)
+        if backend != version:
+            backend = f"{backend}` (failover from `{version}`)"
+        else:
+            backend = f"{backend}`"
+
+        files = []
+        empty = "`No Output.`"
+        if img:
+            text, data = split_png(stdout)
+            try:
+                png = await self.bot.loop.run_in_executor(
+                    None, decode_png, data, CloudAHKConfig.max_image_pixels
+                )
+            except ValueError as e:
+                stdout = f"{stdout}\n\nNo image: {e}"
+            else:
+                stdout = text
+                empty = ""
+                files.append(discord.File(io.BytesIO(png), "img.png"))
+
+        processing_time = (
+            "{0:.1f} seconds".format(time)
+            if time is not None
+            else "unknown"
+            if result.get("truncated")
+            else "Timed out"
+        )
+        await send_output(
+            ctx,
+            stdout,
+            prefix=f"{ctx.author.mention}\nLanguage: `{language}`\n",
+            suffix=(
+                f"\n`Processing time: {processing_time}`"
+                f"\n*CloudAHK Backend Variant: `{backend}*"
+            ),
+            language=language,
+            empty=empty,
+            files=files,
             reference=ctx.message.to_reference(fail_if_not_exists=False),
         )
 
@@ -190,12 +558,7 @@ class CloudAHK(commands.Cog):
     async def ahk(self, ctx, *, code: RunnableCodeConverter = None):
         """Run AHK code through CloudAHK. Example: `ahk print("hello world!")`"""
 
-        stdout, time = await self.cloudahk_call(ctx, code, version="stable")
-
-        # # logging for security purposes and checking for abuse
-        # with open('ahk_eval/{0}_{1}_{2}'.format(ctx.guild.id, ctx.author.id, ctx.message.id), 'w', encoding='utf-8-sig') as f:
-        #     f.write('{0}\n\nCODE:\n{1}\n\nPROCESSING TIME: {2}\n\nSTDOUT:\n{3}\n'.format(
-        #         ctx.stamp, code, time, stdout))
+        await self.cloudahk_call(ctx, code, version="stable")
 
     @commands.command(name="dev2")
     @commands.is_owner()
@@ -203,12 +566,52 @@ class CloudAHK(commands.Cog):
     async def ahk2(self, ctx, *, code: RunnableCodeConverter):
         """Run AHK code through CloudAHK. Example: `ahk print("hello world!")`"""
 
-        stdout, time = await self.cloudahk_call(ctx, code, lang="ahk2", version="dev")
+        await self.cloudahk_call(ctx, code, lang="ahk2", version="dev")
+
+    @ahk.command(name="fresh")
+    @commands.cooldown(rate=5.0, per=25.0, type=commands.BucketType.user)
+    async def ahk_fresh(self, ctx, *, code: RunnableCodeConverter = None):
+        """Run AHK code through CloudAHK, skipping any cached result."""
+
+        await self.cloudahk_call(ctx, code, version="stable", cache=False)
+
+    @ahk.command(name="batch")
+    @commands.cooldown(rate=2.0, per=25.0, type=commands.BucketType.user)
+    async def ahk_batch(self, ctx, *, code: RunnableCodeConverter = None):
+        """Run every code block in a message through CloudAHK and reply with all the results."""
+
+        await self.cloudahk_batch(ctx, code, version="stable")
+
+    @ahk.command(name="cache")
+    @commands.is_owner()
+    async def ahk_cache(self, ctx, action: str = None):
+        """Show the CloudAHK result cache counters. Pass `clear` to empty it."""
+        if action == "clear":
+            self.result_cache.clear()
+        stats = self.result_cache.stats()
+        await ctx.send(
+            "```\n{size}/{maxsize} entries\n"
+            "{hits} hits, {misses} misses ({hit_rate:.1%})\n"
+            "{evictions} evictions\n"
+            "{calls} backend calls, {coalesced} coalesced\n```".format(
+                calls=self.inflight.calls, coalesced=self.inflight.coalesced, **stats
+            )
+        )
 
-        # logging for security purposes and checking for abuse
-        # with open('ahk_eval/{0}_{1}_{2}'.format(ctx.guild.id, ctx.author.id, ctx.message.id), 'w', encoding='utf-8-sig') as f:
-        #     f.write('{0}\n\nCODE:\n{1}\n\nPROCESSING TIME: {2}\n\nSTDOUT:\n{3}\n'.format(
-        #         ctx.stamp, code, time, stdout))
+    async def _stress(self, ctx: commands.Context, code: str, versions: tuple):
+        """Run %code% once per entry of %versions% through the schedulers, bypassing the cache."""
+        results = await asyncio.gather(
+            *(
+                self.cloudahk_call(ctx, code, version=version, cache=False)
+                for version in versions
+            ),
+            return_exceptions=True,
+        )
+        failed = [r for r in results if isinstance(r, Exception)]
+        for error in failed:
+            log.error("stress run failed: %r", error)
+        if failed:
+            await ctx.send(f"{len(failed)} of {len(results)} runs failed.")
 
     @ahk.command(name="num")
     @commands.is_owner()
@@ -217,30 +620,26 @@ class CloudAHK(commands.Cog):
         """Run AHK code through CloudAHK Stable multiple times for stress testing. Example: `ahk print("hello world!")`"""
         if num > 10:
             raise Exception
-        for i in range(num):
-            asyncio.create_task(ctx.invoke(self.bot.get_command("ahk"), code=code))
-        return
+        await self._stress(ctx, code, ("stable",) * num)
 
     @commands.group(name="beta", invoke_without_command=True)
     @commands.cooldown(rate=5.0, per=25.0, type=commands.BucketType.user)
     async def cloud_beta(self, ctx, *, code: RunnableCodeConverter):
         """Run AHK code through CloudAHK. Example: `ahk print("hello world!")`"""
 
-        stdout, time = await self.cloudahk_call(ctx, code, version="beta")
+        await self.cloudahk_call(ctx, code, version="beta")
 
     @cloud_beta.command(name="img")
     async def cloud_beta_img(self, ctx, *, code: RunnableCodeConverter):
 
-        stdout, time = await self.cloudahk_call(ctx, code, version="beta", img=True)
+        await self.cloudahk_call(ctx, code, version="beta", img=True)
 
     @commands.group(name="snek", invoke_without_command=True)
     @commands.cooldown(rate=5.0, per=25.0, type=commands.BucketType.user)
     async def cloud_snek(self, ctx, *, code: RunnableCodeConverter):
         """Run AHK code through snek. Example: `python print("hello world!")`"""
 
-        stdout, time = await self.cloudahk_call(
-            ctx, code, version="snekbox", lang="eval"
-        )
+        await self.cloudahk_call(ctx, code, version="snekbox", lang="eval")
 
     @commands.group(name="dev", invoke_without_command=True)
     @commands.is_owner()
@@ -248,12 +647,79 @@ class CloudAHK(commands.Cog):
     async def cloud_dev(self, ctx, *, code: RunnableCodeConverter):
         """Run AHK code through CloudAHK. Example: `ahk print("hello world!")`"""
 
-        stdout, time = await self.cloudahk_call(ctx, code, version="dev")
+        await self.cloudahk_call(ctx, code, version="dev")
 
-        # logging for security purposes and checking for abuse
-        # with open('ahk_dev_eval/{0}_{1}_{2}'.format(ctx.guild.id, ctx.author.id, ctx.message.id), 'w', encoding='utf-8-sig') as f:
-        #     f.write('{0}\n\nCODE:\n{1}\n\nPROCESSING TIME: {2}\n\nSTDOUT:\n{3}\n'.format(
-        #         ctx.stamp, code, time, stdout))
+    @cloud_dev.command(name="audit")
+    @commands.is_owner()
+    async def dev_audit(self, ctx, *filters: str):
+        """Search the execution audit log.
+
+        Filters: `user:<id|mention>`, `guild:<id>`, `since:<2h|7d|...>`,
+        `until:<duration>` and `limit:<n>`, e.g. `dev audit user:1234 since:1d`
+        """
+        query = {"limit": 10}
+        now = datetime.utcnow().timestamp()
+        for item in filters:
+            key, _, value = item.partition(":")
+            if key in ("user", "guild", "limit"):
+                value = value.strip("<@!>")
+                if not value.isdigit():
+                    raise commands.BadArgument(f"`{key}` takes a number, not `{value}`")
+                query[key] = int(value)
+            elif key in ("since", "until"):
+                match = DURATION_RE.fullmatch(value)
+                if match is None:
+                    raise commands.BadArgument(
+                        f"`{key}` takes a duration like 2h or 7d"
+                    )
+                amount, unit = match.groups()
+                query[key] = now - int(amount) * DURATION_UNITS[unit]
+            else:
+                raise commands.BadArgument(f"Unknown filter `{item}`")
+
+        records = await self.audit.query(**query)
+        lines = []
+        for record in records:
+            when = datetime.utcfromtimestamp(record["ts"])
+            lines.append(
+                f"{when:%Y-%m-%d %H:%M:%S} user {record['user']} "
+                f"guild {record['guild']} {record['backend']}/{record['lang']} "
+                f"{'cached ' if record['cached'] else ''}time {record['time']}"
+            )
+            lines.append(record["code"])
+            lines.append("")
+        await send_output(
+            ctx,
+            "\n".join(lines),
+            prefix=f"{len(records)} matching executions "
+            f"({self.audit.written} written, {self.audit.dropped} dropped)\n",
+            language="ahk",
+            filename="audit.txt",
+            empty="No matching executions.",
+        )
+
+    @cloud_dev.command(name="health")
+    @commands.is_owner()
+    async def dev_health(self, ctx):
+        """Show the health, latency and queue of each CloudAHK backend."""
+        now = datetime.utcnow()
+        lines = []
+        for backend in self.backends:
+            latency = "-"
+            if backend.latency is not None:
+                latency = f"{backend.latency * 1000:.0f}ms"
+            probed = "never"
+            if backend.last_probe is not None:
+                probed = f"{(now - backend.last_probe).total_seconds():.0f}s ago"
+            lines.append(
+                f"{backend.name:<8} {'up' if backend.healthy else 'DOWN':<4} "
+                f"{latency:>7} err {backend.error_score:.2f} "
+                f"run {backend.scheduler.running} queue {backend.scheduler.queued} "
+                f"probed {probed}"
+            )
+            if backend.last_error:
+                lines.append(f"{'':<8} last error: {backend.last_error}")
+        await ctx.send("```\n{}\n```".format("\n".join(lines) or "No backends."))
 
     @cloud_dev.command(name="num")
     @commands.is_owner()
@@ -262,9 +728,7 @@ class CloudAHK(commands.Cog):
         """Run AHK code through CloudAHK Dev multiple times for stress testing. Example: `ahk print("hello world!")`"""
         if num > 10:
             raise Exception
-        for i in range(num):
-            asyncio.create_task(ctx.invoke(self.bot.get_command("dev"), code=code))
-        return
+        await self._stress(ctx, code, ("dev",) * num)
 
     @cloud_dev.command()
     @commands.is_owner()
@@ -273,12 +737,33 @@ class CloudAHK(commands.Cog):
         """Run AHK code through CloudAHK Dev multiple times for stress testing. Example: `ahk print("hello world!")`"""
         if num > 5:
             raise Exception
-        for i in range(num):
-            asyncio.create_task(ctx.invoke(self.bot.get_command("ahk"), code=code))
-            asyncio.create_task(ctx.invoke(self.bot.get_command("beta"), code=code))
-            asyncio.create_task(ctx.invoke(self.bot.get_command("dev"), code=code))
+        await self._stress(ctx, code, ("stable", "beta", "dev") * num)
 
-        return
+    @commands.command(name="docs", aliases=["d"])
+    @commands.cooldown(rate=5.0, per=25.0, type=commands.BucketType.user)
+    async def docs_search(self, ctx, *, query: str):
+        """Search the AutoHotkey documentation. Example: `docs MsgBox`"""
+        if self.docs is None:
+            raise commands.CommandError("The docs index hasn't been built or loaded.")
+
+        results = self.docs.search(query)
+        if not results:
+            raise commands.CommandError(f"Nothing in the docs matched `{query}`.")
+
+        (best, _), others = results[0], results[1:]
+        e = discord.Embed(
+            title=best.name, url=DOCS_FORMAT.format(best.path), color=AHK_COLOR
+        )
+        e.set_footer(text=best.kind.capitalize())
+        if others:
+            e.add_field(
+                name="See also",
+                value="\n".join(
+                    f"[{entry.name}]({DOCS_FORMAT.format(entry.path)})"
+                    for entry, _ in others
+                ),
+            )
+        await ctx.send(embed=e)
 
     @commands.command(hidden=True)
     @commands.cooldown(rate=1.0, per=5.0, type=commands.BucketType.user)
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import aiohttp
+import discord
+import verboselogs
+from bot import Bot
+from cogs.cloudahk import AHK_COLOR
+from constants import Feed
+from discord.ext import commands
+from lxml import etree
+from utils.cache import BoundedSet
+from utils.http import CHUNK_SIZE
+
+log: verboselogs.VerboseLogger = logging.getLogger(__name__)
+
+# only needs the channel, which the guilds intent always caches
+REQUIRED_INTENTS = ()
+
+RSS_URL = "https://www.autohotkey.com/boards/feed"
+
+ENTRY_TAGS = ("entry", "item")
+
+
+def _localname(el: etree._Element) -> str:
+    return etree.QName(el).localname if isinstance(el.tag, str) else ""
+
+
+def _child(el: etree._Element, *names: str) -> Optional[etree._Element]:
+    for child in el:
+        if _localname(child) in names:
+            return child
+    return None
+
+
+def _text(el: Optional[etree._Element]) -> str:
+    return "" if el is None else (el.text or "").strip()
+
+
+def parse_entry(el: etree._Element) -> dict:
+    """Pull the fields we post out of an Atom entry or an RSS item."""
+    link = _child(el, "link")
+    author = _child(el, "author", "creator")
+    if author is not None and len(author):
+        author = _child(author, "name")
+    return {
+        "id": _text(_child(el, "id", "guid")) or _text(link),
+        "title": _text(_child(el, "title")),
+        "link": (link.get("href") or _text(link)) if link is not None else "",
+        "author": _text(author),
+        "published": _text(_child(el, "published", "updated", "pubDate")),
+    }
+
+
+class ForumFeed(commands.Cog):
+    """Posts new AutoHotkey forum topics to a channel."""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.interval: float = Feed.min_interval
+        self.last_poll: Optional[datetime] = None
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.seen = BoundedSet(Feed.seen_size)
+        self._load_state()
+
+        self._task: Optional[asyncio.Task] = None
+
+    async def deferred_setup(self):
+        if Feed.channel_id:
+            self._task = self.bot.loop.create_task(self._poll_loop())
+        else:
+            log.info("FEED_CHANNEL_ID isn't set, not polling the forum feed.")
+
+    def cog_unload(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._save_state()
+
+    def _load_state(self) -> None:
+        try:
+            with open(Feed.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.etag = state.get("etag")
+        self.last_modified = state.get("last_modified")
+        self.seen = BoundedSet(Feed.seen_size, state.get("seen", ()))
+
+    def _save_state(self) -> None:
+        path = Path(Feed.state_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        state = {
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "seen": list(self.seen),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+    async def poll(self) -> List[dict]:
+        """Fetch the feed and return the entries we haven't seen, newest first.
+
+        The feed lists newest entries first, so parsing stops at the first
+        entry we have already seen and the rest of the body is never read.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+
+        new = []
+        async with self.bot.http_session.get(
+            RSS_URL, headers=headers, timeout=aiohttp.ClientTimeout(total=30)
+        ) as resp:
+            self.last_poll = datetime.utcnow()
+            if resp.status == 304:
+                return new
+            if resp.status != 200:
+                raise commands.CommandError(f"Feed returned {resp.status}.")
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+
+            parser = etree.XMLPullParser(events=("end",))
+            caught_up = False
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                parser.feed(chunk)
+                for _, el in parser.read_events():
+                    if _localname(el) not in ENTRY_TAGS:
+                        continue
+                    entry = parse_entry(el)
+                    el.clear()
+                    if entry["id"] in self.seen:
+                        caught_up = True
+                        break
+                    new.append(entry)
+                if caught_up:
+                    resp.close()
+                    break
+        # only once the body is parsed, or a failed poll's entries would get a 304
+        self.etag = etag
+        self.last_modified = last_modified
+        return new
+
+    def _next_interval(self, found: bool) -> float:
+        if found:
+            return max(Feed.min_interval, self.interval / 2)
+        return min(Feed.max_interval, self.interval * 1.5)
+
+    async def _poll_loop(self) -> None:
+        await self.bot.wait_until_ready()
+        while True:
+            new = []
+            try:
+                new = await self.poll()
+                if new:
+                    # the first poll only learns what is already there
+                    if len(self.seen):
+                        await self.post(reversed(new))
+                    for entry in new:
+                        self.seen.add(entry["id"])
+                    await self.bot.loop.run_in_executor(None, self._save_state)
+            except (aiohttp.ClientError, asyncio.TimeoutError, etree.Error) as e:
+                log.warning("Polling the forum feed failed: %r", e)
+            except commands.CommandError as e:
+                log.warning(str(e))
+            except Exception:
+                # anything else would end the loop without a word
+                log.exception("Polling the forum feed failed")
+
+            self.interval = self._next_interval(bool(new))
+            log.debug("Forum feed: %d new, next poll in %.0fs", len(new), self.interval)
+            await asyncio.sleep(self.interval)
+
+    async def post(self, entries) -> None:
+        channel = self.bot.get_channel(Feed.channel_id)
+        if channel is None:
+            log.warning("Feed channel %s not found.", Feed.channel_id)
+            return
+        for entry in entries:
+            e = discord.Embed(
+                title=entry["title"][:256], url=entry["link"], color=AHK_COLOR
+            )
+            if entry["author"]:
+                e.set_author(name=entry["author"])
+            if entry["published"]:
+                e.set_footer(text=entry["published"])
+            try:
+                await channel.send(embed=e)
+            except discord.HTTPException as error:
+                log.warning("Couldn't post feed entry %s: %r", entry["id"], error)
+
+    @commands.command(name="feed", hidden=True)
+    @commands.is_owner()
+    async def feed_status(self, ctx: commands.Context):
+        """Show the state of the forum feed poller."""
+        last_poll = "never" if self.last_poll is None else f"{self.last_poll:%H:%M:%S}"
+        await ctx.send(
+            "```\n"
+            f"channel:       {Feed.channel_id or 'off'}\n"
+            f"last poll:     {last_poll} UTC\n"
+            f"interval:      {self.interval:.0f}s\n"
+            f"etag:          {self.etag}\n"
+            f"last modified: {self.last_modified}\n"
+            f"seen entries:  {len(self.seen)}/{self.seen.maxsize}\n"
+            "```"
+        )
+
+
+def setup(bot: Bot):
+    bot.add_cog(ForumFeed(bot))
@@ -5,43 +5,95 @@ import logging
 import textwrap
 import time
 import typing
-from io import BytesIO
 from pathlib import Path
 
 import discord
-import pygit2
 import verboselogs
 from bot import Bot
 from constants import Github
 from discord.errors import DiscordException
 from discord.ext import commands
 from utils.file import create_file_obj
+from utils.github_cache import GithubCache
+from utils.source_index import SourceIndex
+from utils.telemetry import percentile
 
 github_link = Github.Me.html_link
 log: verboselogs.VerboseLogger = logging.getLogger(__name__)
 
+# the github emoji in =source comes from the emoji cache
+REQUIRED_INTENTS = ("messages", "emojis")
+
 
 class Meta(commands.Cog):
     """A couple of simple commands."""
 
     def __init__(self, bot: Bot):
         self.bot = bot
+        self.github = GithubCache(Github.cache_dir, Github.cache_size)
+        self.sources = SourceIndex()
+
+    async def deferred_setup(self):
+        # extensions loaded from here on are indexed as they load
+        for extension in self.bot.extensions:
+            self.sources.index(self.bot, extension)
+
+    @commands.Cog.listener()
+    async def on_extension_load(self, name: str):
+        self.sources.index(self.bot, name)
+
+    @commands.Cog.listener()
+    async def on_extension_unload(self, name: str):
+        self.sources.drop(name)
 
     @commands.command(name="ping")
     async def ping(self, ctx: commands.Context):
-        """Get the bot's current websocket and API latency."""
-        start_time = time.time()
+        """Get the bot's current websocket and API latency, and their history."""
+        start_time = time.perf_counter()
         message = await ctx.send("Ping!")
-        end_time = time.time()
+        rest = time.perf_counter() - start_time
+        monitor = self.bot.latency_monitor
+        monitor.record_ping(rest)
+
+        hour_ago = time.time() - 60 * 60
+        shard_id = ctx.guild.shard_id if ctx.guild else 0
+        shard = monitor.shards.get(shard_id)
+        gateway = shard.values(hour_ago) if shard is not None else []
+        lines = [
+            f"{'':<8}{'now':>8}{'p50':>8}{'p99':>8}",
+            "{:<8}{:>6.0f}ms{:>6.0f}ms{:>6.0f}ms".format(
+                f"shard {shard_id}",
+                self.bot.get_shard(shard_id).latency * 1000,
+                percentile(gateway, 50) * 1000,
+                percentile(gateway, 99) * 1000,
+            ),
+            "{:<8}{:>6.0f}ms{:>6.0f}ms{:>6.0f}ms".format(
+                "api",
+                (monitor.rest.last or 0.0) * 1000,
+                monitor.rest.percentile(50, hour_ago) * 1000,
+                monitor.rest.percentile(99, hour_ago) * 1000,
+            ),
+            "{:<8}{:>6.0f}ms{:>6.0f}ms{:>6.0f}ms".format(
+                "=ping",
+                rest * 1000,
+                monitor.pings.percentile(50, hour_ago) * 1000,
+                monitor.pings.percentile(99, hour_ago) * 1000,
+            ),
+        ]
+        worst = monitor.worst_shard(hour_ago)
+        if worst is not None and len(monitor.shards) > 1:
+            lines.append(f"worst shard: {worst[0]} (p99 {worst[1] * 1000:.0f}ms)")
 
         await message.edit(
-            content=f"Pong! {round(self.bot.latency * 1000)}ms\nAPI: {round((end_time - start_time) * 1000)}ms"
+            content="Pong! p50/p99 over the last hour:\n```\n{}\n```".format(
+                "\n".join(lines)
+            )
         )
 
     @commands.command(name="invite")
     async def _invite(self, ctx: commands.Context):
         """Return the bot invite, and a notice if it is not public."""
-        app_info: discord.AppInfo = await self.bot.application_info()
+        app_info: discord.AppInfo = await self.bot.assets.application_info()
         await ctx.reply(
             f"Invite me here!\n<{self.bot.invite_link.format(self.bot.user.id)}> \n"
             "**Warning!** I am currently not a public bot and may never be!"
@@ -88,19 +140,16 @@ class Meta(commands.Cog):
             Github.api_link, Github.Me.org, Github.Me.repo, file.lstrip("/")
         )
         # try the master branch
-        async with self.bot.http_session.get(f"{src_link_no_branch}") as resp:
-            if resp.status != 404 and resp.status != 200:
-                raise commands.CommandError("Command Not [on github].")
-            json = await resp.json()
-
-        link, found_branch, docstring, path = self._get_get_source(func, json)
+        json = await self.github.get(self.bot.http_session, src_link_no_branch)
+        link, found_branch = None, None
+        if json is not None:
+            link, found_branch, docstring, path = self._get_get_source(func, json)
         if link is None and branch is not None and found_branch != branch:
-            async with self.bot.http_session.get(
-                f"{src_link_no_branch}?ref={branch}"
-            ) as resp:
-                if resp.status != 200:
-                    raise commands.CommandError("Command Not [on github].")
-                json = await resp.json()
+            json = await self.github.get(
+                self.bot.http_session, src_link_no_branch, branch
+            )
+            if json is None:
+                raise commands.CommandError("Command Not [on github].")
             link, found_branch, docstring, _ = self._get_get_source(func, json, branch)
         if link is None:
             raise commands.CommandError("Command Not [on github].")
@@ -124,22 +173,32 @@ class Meta(commands.Cog):
 
         if cmd is None:
             raise commands.CommandError("Couldn't find command.")
-        callback = cmd.callback
-        source_file = str(
-            Path(inspect.getsourcefile(callback)).relative_to(str(Path.cwd()))
-        )
-
-        # determine the current branch
+        # the current branch, or commit if HEAD is detached
         # this is used to get which branch we should look in on the repo if we can't find the command on the main/master branch
-        repo = pygit2.Repository(".git")
-        for branch in list(repo.branches.local):
-            b = repo.lookup_branch(branch)
-            if b.is_head():
-                break
-
-        link, doc_string, branch = await self._get_source(
-            callback.__name__, source_file, branch
-        )
+        branch = self.bot.git.ref or "master"
+
+        entry = self.sources.get(cmd.qualified_name)
+        if entry is not None:
+            source_file = entry.path
+            doc_string = entry.docstring
+            link = "{0}/{1}/{2}/tree/{3}/{4}#L{5}-L{6}".format(
+                Github.base_link,
+                Github.Me.org,
+                Github.Me.repo,
+                branch,
+                entry.path,
+                entry.start,
+                entry.end,
+            )
+        else:
+            # not indexed, so look for it on github
+            callback = cmd.callback
+            source_file = str(
+                Path(inspect.getsourcefile(callback)).relative_to(str(Path.cwd()))
+            )
+            link, doc_string, branch = await self._get_source(
+                callback.__name__, source_file, branch
+            )
 
         # check for image permissions and if we don't have them then just send the link and be lazy.
         if not ctx.channel.permissions_for(ctx.me) >= discord.Permissions(
@@ -152,10 +211,7 @@ class Meta(commands.Cog):
         e = discord.Embed()
         e.description = f"{doc_string}\n\n" f""
         e.title = cmd.qualified_name
-        thumb = discord.File(
-            BytesIO(await self.bot.user.avatar_url_as(format="png").read()),
-            filename="thumb.png",
-        )
+        thumb = await self.bot.assets.avatar_file("thumb.png")
         e.set_thumbnail(url="attachment://thumb.png")
         e.set_footer(text=f"/{source_file}")
         e.add_field(
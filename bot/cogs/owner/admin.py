@@ -18,6 +18,7 @@ import io
 import logging
 import os
 import re
+import resource
 import subprocess
 import sys
 import textwrap
@@ -39,9 +40,13 @@ from bot import Bot
 from constants import MESSAGE_LIMIT
 from discord.ext import commands
 from utils.file import create_file_obj
+from utils.memory import cache_report
+from utils.render import send_output
 
 log: verboselogs.VerboseLogger = logging.getLogger(__name__)
 
+REQUIRED_INTENTS = ("messages", "reactions")
+
 
 class PerformanceMocker:
     """A mock object that can also be used in await expressions."""
@@ -282,47 +287,33 @@ class Admin(commands.Cog):
                 allowed_mentions=discord.AllowedMentions(replied_user=False),
                 reference=ctx.message.to_reference(fail_if_not_exists=False),
             )
-        resp_file: discord.File = None
-        # for now, we're not gonna handle exceptions as files
-        # unless, for some reason, it has a ``` in it
-        error_file: discord.File = None
-        total_len = 0
-        fmt_resp: str = "```py\n{}```"
         fmt_err: str = "\nAn error occured. Unforunate.```py\n{}```"
         out = ""
         files = []
 
-        # make a resp object
-        if resp is not None:
-            total_len += len(fmt_resp)
-            total_len += len(resp)
-            if "```" in resp:
-                resp_file = True
-
         if error is not None:
-            total_len += len(fmt_err)
-            total_len += len(error)
-            if "```" in error:
-                error_file = True
-
-        if total_len > MESSAGE_LIMIT or resp_file:
-            log.debug("rats we gotta upload as a file")
-            resp_file: discord.File = create_file_obj(resp, ext="py")
-        else:
-            # good job, not a file
-            log.debug("sending response as plaintext")
-            out += fmt_resp.format(resp) if resp is not None else ""
-        out += fmt_err.format(error) if error is not None else ""
-
-        for f in resp_file, error_file:
-            if f is not None:
-                files.append(f)
-        return await ctx.send(
-            out,
-            files=files,
+            out = fmt_err.format(error)
+            # tracebacks don't page well, so a long one goes up as a file
+            if len(out) > MESSAGE_LIMIT // 2 or "```" in error:
+                log.debug("rats we gotta upload the error as a file")
+                files.append(create_file_obj(error, name="error", ext="py"))
+                out = "\nAn error occured. Unforunate. See attached file."
+
+        kwargs = dict(
             allowed_mentions=discord.AllowedMentions(replied_user=False),
             reference=ctx.message.to_reference(fail_if_not_exists=False),
         )
+        if resp is None:
+            return await ctx.send(out, files=files or None, **kwargs)
+        return await send_output(
+            ctx,
+            resp,
+            suffix=out,
+            language="py",
+            filename="results.py",
+            files=files,
+            **kwargs,
+        )
 
     @commands.command(pass_context=True, hidden=True, name="eval", aliases=["e"])
     async def _eval(self, ctx: commands.Context, *, code: str):
@@ -343,7 +334,7 @@ class Admin(commands.Cog):
         env.update(globals())
         log.spam("updated globals")
         code = self.cleanup_code(code)
-        log.spam(f"body: {code}")
+        log.spam("body: %s", code)
         stdout = io.StringIO()
         result = None
         error = None
@@ -372,7 +363,7 @@ class Admin(commands.Cog):
             await ctx.message.add_reaction("\u2705")
         except Exception:
             pass
-        log.spam(f"result: {result}")
+        log.spam("result: %s", result)
         if result is not None:
             pprint(result, stream=stdout)
         result = stdout.getvalue()
@@ -517,6 +508,44 @@ class Admin(commands.Cog):
         for i in range(times):
             await new_ctx.reinvoke()
 
+    @commands.command(hidden=True)
+    async def startup(self, ctx):
+        """Shows how long each part of startup took."""
+        await send_output(ctx, self.bot.startup.report())
+
+    @commands.command(hidden=True)
+    async def http(self, ctx):
+        """Shows the counters and latencies of outgoing http requests."""
+        await send_output(ctx, self.bot.http_metrics.report())
+
+    @commands.command(hidden=True)
+    async def slow(self, ctx, limit: int = 10):
+        """Shows the slowest commands and the recent slow invocations."""
+        await send_output(ctx, self.bot.command_stats.report(limit))
+
+    @commands.command(hidden=True)
+    async def memory(self, ctx):
+        """Shows roughly how much memory each of discord.py's caches holds."""
+        members = [member for guild in self.bot.guilds for member in guild.members]
+        report = cache_report(
+            (
+                ("guilds", self.bot.guilds),
+                ("members", members),
+                ("users", self.bot.users),
+                ("messages", self.bot.cached_messages),
+            )
+        )
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        intents = ", ".join(name for name, on in self.bot.intents if on)
+        cached = ", ".join(
+            name for name, on in self.bot._connection.member_cache_flags if on
+        )
+        await send_output(
+            ctx,
+            f"{report}\n\npeak rss: {peak:.0f}MiB\n"
+            f"intents: {intents}\nmember cache: {cached or 'none'}",
+        )
+
     @commands.command(hidden=True)
     async def perf(self, ctx, *, command):
         """Checks the timing of a command, attempting to suppress HTTP and DB calls."""
@@ -1,3 +1,5 @@
+from os import getenv
+
 MESSAGE_LIMIT = 2000
 
 
@@ -12,6 +14,49 @@ class Github:
 
     # Me = Me()
 
+    # contents api responses, revalidated with their etag
+    cache_dir = "data/github_cache"
+    cache_size = 128
+
+
+class Client:
+    # "all", "default", or "lean" for only the intents the loaded extensions
+    # declare in REQUIRED_INTENTS
+    intents = getenv("INTENTS_PROFILE", "all")
+    # "intents" caches whatever the intents allow, "none" only the bot's own member
+    member_cache = getenv("MEMBER_CACHE", "intents")
+    # request every guild's members at startup; needs the members intent
+    chunk_guilds = getenv("CHUNK_GUILDS", "true").lower() == "true"
+
+
+class Logging:
+    # also log to this file, rotated at midnight; empty for only the terminal
+    file = getenv("LOG_FILE", "")
+    file_level = getenv("LOG_FILE_LEVEL", "INFO")
+    backups = 14
+
+
+class Metrics:
+    # the fraction of outgoing http requests that get logged
+    http_log_sample = float(getenv("HTTP_LOG_SAMPLE", 0))
+    # serve /metrics on this port; 0 turns the endpoint off
+    port = int(getenv("METRICS_PORT", 0))
+    host = getenv("METRICS_HOST", "127.0.0.1")
+    # commands taking longer than this many seconds are logged with a breakdown
+    slow_command = float(getenv("SLOW_COMMAND_SECONDS", 5))
+    slow_log_size = 50
+
+
+class Feed:
+    # forum topics are posted here; 0 turns the poller off
+    channel_id = int(getenv("FEED_CHANNEL_ID", 0))
+    # the poll interval shrinks while topics come in and grows while they don't
+    min_interval = 60
+    max_interval = 30 * 60
+    # entry ids remembered across restarts so nothing is posted twice
+    seen_size = 512
+    state_path = "data/feed_state.json"
+
 
 class Colors:
     blue = 0x0279FD
@@ -27,3 +72,89 @@ class Colors:
     python_blue = 0x4B8BBE
     python_yellow = 0xFFD43B
     grass_green = 0x66FF00
+
+
+class Audit:
+    # every code execution is logged here for checking abuse
+    directory = "logs/audit"
+    # the current file is rotated once it grows past this
+    max_bytes = 8 * 2**20
+    flush_interval = 5
+    # records kept in memory between flushes; the oldest are dropped past this
+    max_pending = 10000
+    # how much of the code and output each record keeps
+    max_code = 64 * 1024
+    max_stdout = 2048
+
+
+class CloudAHKConfig:
+    # cached results are keyed by (variant, lang, code hash)
+    cache_size = 256
+    cache_ttl = 60 * 30
+    # outputs larger than this aren't worth holding on to
+    cache_max_output = 64 * 1024
+    # responses are cut off past this size; keep it under the upload limit in
+    # utils.file so a cut off result can still be attached
+    max_response_bytes = 800000 - 1024
+    # images larger than this are rejected from their header, before decoding
+    max_image_pixels = 4096 * 4096
+    # code blocks `=ahk batch` runs from one message
+    max_batch = 5
+    # pastebin code fetched for a run
+    max_paste_bytes = 128 * 1024
+    paste_cache_size = 64
+    # built by utils/docs_index.py from a local copy of the docs
+    docs_index_path = "data/ahk_docs_index.json"
+    # each backend reads its url, user and password from these names in config.
+    # concurrency is how many requests it runs at once, queue_size how many more
+    # may wait in line, and connection_limit caps its own connection pool.
+    backends = {
+        "stable": {
+            "kind": "cloudahk",
+            "config": ("CLOUDAHK_URL", "CLOUDAHK_USER", "CLOUDAHK_PASS"),
+            "concurrency": 4,
+            "queue_size": 32,
+            "connection_limit": 8,
+            "timeout": 20,
+            # backends that run the same code and may stand in when this one is down
+            "failover": ("beta",),
+        },
+        "beta": {
+            "kind": "cloudahk",
+            "config": ("CLOUDAHK_URL_BETA", "CLOUDAHK_USER_BETA", "CLOUDAHK_PASS_BETA"),
+            "concurrency": 2,
+            "queue_size": 16,
+            "connection_limit": 4,
+            "timeout": 20,
+        },
+        "dev": {
+            "kind": "cloudahk",
+            "config": ("CLOUDAHK_URL_DEV", "CLOUDAHK_USER_DEV", "CLOUDAHK_PASS_DEV"),
+            "concurrency": 2,
+            "queue_size": 16,
+            "connection_limit": 4,
+            "timeout": 20,
+        },
+        "snekbox": {
+            "kind": "snekbox",
+            "config": ("SNEKBOX_URL_DEV", "SNEKBOX_USER_DEV", "SNEKBOX_PASS_DEV"),
+            "concurrency": 2,
+            "queue_size": 16,
+            "connection_limit": 4,
+            "timeout": 20,
+        },
+    }
+    # "failover" lets requests move to a backend's failover hosts, "strict" never does
+    routing = "failover"
+    # health probes double as keep-alive for each backend's connections
+    probe_interval = 30
+    probe_timeout = 5
+    # weight of the newest sample in the latency and error averages
+    health_alpha = 0.3
+    # backends with an error score above this are skipped while others are healthy
+    unhealthy_error_score = 0.5
+    connect_timeout = 5
+    keepalive_timeout = 60
+    dns_cache_ttl = 300
+    # how long shutdown waits for queued requests before cancelling them
+    drain_timeout = 25
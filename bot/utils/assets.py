@@ -0,0 +1,52 @@
+import io
+from typing import Any, Awaitable, Callable, Hashable
+
+import discord
+from discord.ext import commands
+from utils.cache import LRUCache
+from utils.concurrency import SingleFlight
+
+
+class AssetCache:
+    """Rarely changing data about the bot itself, fetched once and kept for `ttl`.
+
+    Avatars are keyed by their hash, so a new avatar is never served stale
+    even before the entry expires.
+    """
+
+    def __init__(self, bot: commands.Bot, ttl: float = 60 * 60, maxsize: int = 16):
+        self.bot = bot
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._inflight = SingleFlight()
+
+    async def _get(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        value = self._cache.get(key)
+        if value is None:
+            value = await self._inflight.run(key, fetch)
+            self._cache.set(key, value)
+        return value
+
+    def invalidate(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    async def avatar(self, format: str = "png") -> bytes:
+        user = self.bot.user
+        return await self._get(
+            ("avatar", user.id, user.avatar, format),
+            user.avatar_url_as(format=format).read,
+        )
+
+    async def avatar_file(
+        self, filename: str = "avatar.png", format: str = "png"
+    ) -> discord.File:
+        """The bot's avatar as a file to send.
+
+        The cached bytes aren't copied; a BytesIO only copies them if written to.
+        """
+        return discord.File(io.BytesIO(await self.avatar(format)), filename=filename)
+
+    async def application_info(self) -> discord.AppInfo:
+        return await self._get(("application_info",), self.bot.application_info)
@@ -0,0 +1,194 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import suppress
+from pathlib import Path
+from typing import Deque, Iterator, List, Optional, Tuple
+
+import verboselogs
+
+log: verboselogs.VerboseLogger = logging.getLogger(__name__)
+
+CURRENT = "audit.jsonl.gz"
+
+
+class AuditLog:
+    """An append-only, size-rotated, gzipped log of code executions.
+
+    Records are queued in memory and written in batches from a thread, so
+    recording one never touches the disk on the event loop. Each batch is
+    appended to the current file as its own gzip member. Once the file grows
+    past `max_bytes` it is renamed after the time range it covers, which lets
+    queries skip whole files. A current file left by an earlier run is renamed
+    the same way before the first write, so nothing is ever appended after a
+    member that a crash cut short.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 8 * 2**20,
+        flush_interval: float = 5.0,
+        max_pending: int = 10000,
+    ):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.pending: Deque[dict] = deque(maxlen=max_pending)
+        self.dropped = 0
+        self.written = 0
+        self._first_ts: Optional[float] = None
+        self._last_ts: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._closing = asyncio.Event()
+        # whether the current file is one this process started
+        self._own_file = False
+
+    def record(self, **fields) -> None:
+        """Queue a record. This only appends to a list."""
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        fields["ts"] = time.time()
+        self.pending.append(fields)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._closing.clear()
+            self._task = asyncio.ensure_future(self._flush_loop())
+
+    async def close(self) -> None:
+        """Stop the flush loop and write out whatever is still queued."""
+        self._closing.set()
+        if self._task is not None and not self._task.done():
+            # the loop writes out the rest itself; cancelling it mid-write
+            # would free the lock while its thread is still appending
+            await self._task
+        else:
+            await self.flush()
+
+    async def _flush_loop(self) -> None:
+        while not self._closing.is_set():
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._closing.wait(), self.flush_interval)
+            try:
+                await self.flush()
+            except OSError:
+                log.exception("Writing the audit log failed")
+
+    async def flush(self) -> None:
+        if not self.pending:
+            return
+        batch = list(self.pending)
+        self.pending.clear()
+        async with self._lock:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self._write, batch)
+        self.written += len(batch)
+
+    def _write(self, batch: List[dict]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        current = self.directory / CURRENT
+        if not self._own_file:
+            if current.exists():
+                # its last write happened no later than the file was modified
+                last = current.stat().st_mtime
+                self._rotate(current, _first_ts(current) or last, last)
+            self._own_file = True
+
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in batch)
+        with open(current, "ab") as f:
+            f.write(gzip.compress(data.encode("utf-8")))
+            size = f.tell()
+
+        if self._first_ts is None:
+            self._first_ts = batch[0]["ts"]
+        self._last_ts = batch[-1]["ts"]
+
+        if size >= self.max_bytes:
+            self._rotate(current, self._first_ts, self._last_ts)
+            self._first_ts = self._last_ts = None
+
+    def _rotate(self, current: Path, first: float, last: float) -> None:
+        rotated = self.directory / "audit-{:.0f}-{:.0f}.jsonl.gz".format(first, last)
+        os.replace(current, rotated)
+        log.info("Rotated audit log to %s", rotated)
+
+    def _files(self) -> Iterator[Tuple[Path, float, float]]:
+        """Every log file with the time range it covers, newest first."""
+        current = self.directory / CURRENT
+        if current.exists():
+            yield current, self._first_ts or 0.0, float("inf")
+        rotated = []
+        for path in self.directory.glob("audit-*-*.jsonl.gz"):
+            try:
+                first, last = path.name[len("audit-") : -len(".jsonl.gz")].split("-")
+                rotated.append((path, float(first), float(last)))
+            except ValueError:
+                continue
+        yield from sorted(rotated, key=lambda r: r[2], reverse=True)
+
+    def _query(
+        self,
+        user: Optional[int],
+        guild: Optional[int],
+        since: Optional[float],
+        until: Optional[float],
+        limit: int,
+    ) -> List[dict]:
+        since = since or 0.0
+        until = until or float("inf")
+        found: List[dict] = []
+        for path, first, last in self._files():
+            if last < since or first > until:
+                continue
+            # files are read a line at a time, keeping only the newest matches
+            matches: Deque[dict] = deque(maxlen=limit - len(found))
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        record = json.loads(line)
+                        if not since <= record["ts"] <= until:
+                            continue
+                        if user is not None and record.get("user") != user:
+                            continue
+                        if guild is not None and record.get("guild") != guild:
+                            continue
+                        matches.append(record)
+            except (OSError, EOFError, ValueError, KeyError) as e:
+                # a crash mid-write leaves a cut off member at the end of a
+                # file, which shouldn't hide everything written before it
+                log.warning("Stopped reading %s early: %r", path, e)
+            found = list(matches) + found
+            if len(found) >= limit:
+                break
+        return found
+
+    async def query(
+        self,
+        user: Optional[int] = None,
+        guild: Optional[int] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 25,
+    ) -> List[dict]:
+        """Return up to `limit` of the newest records matching the filters, oldest first."""
+        await self.flush()
+        async with self._lock:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                None, self._query, user, guild, since, until, limit
+            )
+
+
+def _first_ts(path: Path) -> Optional[float]:
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.loads(f.readline())["ts"]
+    except (OSError, EOFError, ValueError, KeyError):
+        log.warning("Couldn't read the first record of %s", path)
+        return None
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import aiohttp
+import config
+import verboselogs
+from constants import CloudAHKConfig
+from utils.concurrency import FairScheduler
+
+log: verboselogs.VerboseLogger = logging.getLogger(__name__)
+
+
+class BackendUnavailable(Exception):
+    """Raised when a backend couldn't be reached or failed on its side."""
+
+
+class Backend:
+    """A CloudAHK or snekbox host, with its own connection pool and request queue."""
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        user: str,
+        password: str,
+        kind: str = "cloudahk",
+        concurrency: int = 4,
+        queue_size: int = 32,
+        connection_limit: int = 8,
+        timeout: float = 20,
+        failover: Tuple[str, ...] = (),
+        trace_configs: Sequence[aiohttp.TraceConfig] = (),
+    ):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.kind = kind
+        self.connection_limit = connection_limit
+        self.trace_configs = list(trace_configs)
+        # encoded once here rather than on every request
+        self.headers = {"Authorization": aiohttp.BasicAuth(user, password).encode()}
+        self.timeout = aiohttp.ClientTimeout(
+            total=timeout, connect=CloudAHKConfig.connect_timeout
+        )
+        self.scheduler = FairScheduler(name, concurrency, queue_size)
+        self.failover = tuple(failover)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # exponentially weighted health, fed by probes and real requests
+        self.latency: Optional[float] = None
+        self.error_score = 0.0
+        self.last_probe: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return f"<Backend {self.name} {self.kind} {self.url}>"
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The session for this backend, created on first use."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                keepalive_timeout=CloudAHKConfig.keepalive_timeout,
+                ttl_dns_cache=CloudAHKConfig.dns_cache_ttl,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=self.timeout,
+                trace_configs=self.trace_configs,
+            )
+        return self._session
+
+    @property
+    def healthy(self) -> bool:
+        return self.error_score <= CloudAHKConfig.unhealthy_error_score
+
+    @property
+    def score(self) -> float:
+        """Lower is better: probe latency, penalised by recent errors."""
+        latency = self.latency if self.latency is not None else 1.0
+        return latency * (1 + 4 * self.error_score)
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        alpha = CloudAHKConfig.health_alpha
+        self.error_score *= 1 - alpha
+        if latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += alpha * (latency - self.latency)
+
+    def record_error(self, error: str) -> None:
+        alpha = CloudAHKConfig.health_alpha
+        self.error_score += alpha * (1 - self.error_score)
+        self.last_error = error
+
+    async def probe(self) -> None:
+        """Check the backend is answering, which also keeps a connection warm."""
+        start = time.perf_counter()
+        self.last_probe = datetime.utcnow()
+        try:
+            async with self.session.get(
+                self.url,
+                timeout=aiohttp.ClientTimeout(total=CloudAHKConfig.probe_timeout),
+            ) as resp:
+                await resp.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.record_error(f"probe: {e.__class__.__name__}")
+            return
+        if resp.status >= 500:
+            self.record_error(f"probe: {resp.status}")
+        else:
+            self.record_success(time.perf_counter() - start)
+
+    def run_url(self, lang: str) -> str:
+        if self.kind == "snekbox":
+            return f"{self.url}/eval"
+        return f"{self.url}/{lang}/run"
+
+    def payload(self, code: str) -> dict:
+        """Keyword arguments carrying %code% in the shape this backend expects."""
+        if self.kind == "snekbox":
+            return {"json": {"input": code}}
+        return {"data": code}
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """Drain the request queue, then close the connection pool."""
+        await self.scheduler.close(timeout)
+        if self._session is not None:
+            await self._session.close()
+
+
+class BackendRegistry:
+    """All configured backends, by variant name."""
+
+    def __init__(self, backends: Sequence[Backend]):
+        self._backends: Dict[str, Backend] = {b.name: b for b in backends}
+        self._probe_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(
+        cls, trace_configs: Sequence[aiohttp.TraceConfig] = ()
+    ) -> "BackendRegistry":
+        """Build the registry from `CloudAHKConfig.backends` and the credentials in config."""
+        backends = []
+        for name, options in CloudAHKConfig.backends.items():
+            options = dict(options)
+            names = options.pop("config")
+            try:
+                url, user, password = (getattr(config, n) for n in names)
+                unset = [
+                    n for n, value in zip(names, (url, user, password)) if not value
+                ]
+                if unset:
+                    raise ValueError(f"{', '.join(unset)} not set")
+                backend = Backend(
+                    name, url, user, password, trace_configs=trace_configs, **options
+                )
+            except (AttributeError, ValueError) as e:
+                # an unconfigured backend only fails the commands that use it
+                log.warning("Skipping CloudAHK backend %s: %s", name, e)
+                continue
+            backends.append(backend)
+        return cls(backends)
+
+    def __getitem__(self, name: str) -> Backend:
+        return self._backends[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._backends
+
+    def __iter__(self) -> Iterator[Backend]:
+        return iter(self._backends.values())
+
+    def __len__(self) -> int:
+        return len(self._backends)
+
+    def route(self, name: str, failover: bool = True) -> List[Backend]:
+        """The backends to try for a request to %name%, in order.
+
+        The requested backend goes first unless it is unhealthy, followed by its
+        healthy failover hosts from fastest to slowest.
+        """
+        backend = self[name]
+        if not failover or CloudAHKConfig.routing != "failover":
+            return [backend]
+
+        others = sorted(
+            (
+                self._backends[n]
+                for n in backend.failover
+                if n in self._backends and self._backends[n].healthy
+            ),
+            key=lambda b: b.score,
+        )
+        if backend.healthy or not others:
+            return [backend, *others]
+        return [*others, backend]
+
+    def start_health_checks(self) -> None:
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.ensure_future(self._probe_loop())
+
+    def stop_health_checks(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(b.probe() for b in self), return_exceptions=True)
+            await asyncio.sleep(CloudAHKConfig.probe_interval)
@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, Iterable, Iterator, Optional, Set
+
+_MISSING = object()
+
+
+class LRUCache:
+    """A bounded mapping with least-recently-used and optional time-to-live eviction."""
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, *, count: bool = True) -> Any:
+        """Return the value stored for `key`, or `default` if it is missing or expired."""
+        try:
+            value, expires = self._data[key]
+        except KeyError:
+            if count:
+                self.misses += 1
+            return default
+
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            self.evictions += 1
+            if count:
+                self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        if count:
+            self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store `value` under `key`, evicting the least recently used entry if full."""
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            return self._data.pop(key)[0]
+        except KeyError:
+            return default
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the counters of this cache."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class BoundedSet:
+    """A set that forgets its oldest members once it holds `maxsize` of them."""
+
+    def __init__(self, maxsize: int = 512, items: Iterable[Hashable] = ()):
+        self.maxsize = maxsize
+        self._order: Deque[Hashable] = deque()
+        self._items: Set[Hashable] = set()
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._items
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._order)
+
+    def add(self, item: Hashable) -> None:
+        if item in self._items:
+            return
+        self._order.append(item)
+        self._items.add(item)
+        while len(self._order) > self.maxsize:
+            self._items.discard(self._order.popleft())
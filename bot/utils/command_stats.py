@@ -0,0 +1,134 @@
+import logging
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Deque, List, NamedTuple, Tuple
+
+import discord
+import verboselogs
+from discord.ext import commands
+from utils.metrics import Registry
+
+log: verboselogs.VerboseLogger = logging.getLogger(__name__)
+
+
+class TimedContext(commands.Context):
+    """A context that keeps track of where the time of its invocation went.
+
+    `timings` holds seconds by part: `convert` for checks and converters,
+    `send` for sending messages, and whatever else commands add, like
+    `backend` for CloudAHK.
+    """
+
+    def __init__(self, **attrs):
+        super().__init__(**attrs)
+        self.started = time.perf_counter()
+        self.timings: Counter = Counter()
+
+    async def send(self, *args, **kwargs) -> discord.Message:
+        start = time.perf_counter()
+        try:
+            return await super().send(*args, **kwargs)
+        finally:
+            self.timings["send"] += time.perf_counter() - start
+
+    async def reply(self, content=None, **kwargs) -> discord.Message:
+        # replies go through the message rather than send, so time them too
+        start = time.perf_counter()
+        try:
+            return await super().reply(content, **kwargs)
+        finally:
+            self.timings["send"] += time.perf_counter() - start
+
+
+class SlowInvocation(NamedTuple):
+    at: float
+    command: str
+    user: int
+    seconds: float
+    timings: Tuple[Tuple[str, float], ...]
+
+
+def _breakdown(timings) -> str:
+    return ", ".join(f"{part} {seconds * 1000:.0f}ms" for part, seconds in timings)
+
+
+class CommandStats:
+    """Command latencies and error rates, and a log of the slowest invocations.
+
+    The latencies and counts live in the `command_seconds` and
+    `commands_total` metrics of the registry, so this only keeps the log.
+    """
+
+    def __init__(self, registry: Registry, threshold: float, size: int = 50):
+        self.registry = registry
+        self.threshold = threshold
+        self.slow: Deque[SlowInvocation] = deque(maxlen=size)
+
+    async def before_invoke(self, ctx: commands.Context) -> None:
+        if isinstance(ctx, TimedContext):
+            ctx.timings["convert"] = time.perf_counter() - ctx.started
+
+    def record(self, ctx: commands.Context, seconds: float) -> None:
+        if seconds < self.threshold or not isinstance(ctx, TimedContext):
+            return
+        timings = dict(ctx.timings)
+        timings["other"] = max(0.0, seconds - sum(timings.values()))
+        invocation = SlowInvocation(
+            time.time(),
+            ctx.command.qualified_name,
+            ctx.author.id,
+            seconds,
+            tuple(timings.items()),
+        )
+        self.slow.append(invocation)
+        log.warning(
+            "Slow command %s took %.0fms: %s",
+            invocation.command,
+            seconds * 1000,
+            _breakdown(invocation.timings),
+        )
+
+    def report(self, limit: int = 10) -> str:
+        calls = Counter()
+        errors = Counter()
+        for labels, count in self.registry.counters["commands_total"].items():
+            name = dict(labels)["command"]
+            calls[name] += count
+            if dict(labels)["outcome"] == "error":
+                errors[name] += count
+
+        histograms = self.registry.histograms["command_seconds"]
+        slowest = sorted(
+            histograms.items(), key=lambda item: item[1].percentile(99), reverse=True
+        )
+        lines: List[str] = [
+            f"{'command':<20}{'calls':>7}{'errors':>8}{'mean':>9}{'p99':>9}"
+        ]
+        for labels, histogram in slowest[:limit]:
+            name = dict(labels)["command"]
+            p99 = histogram.percentile(99)
+            lines.append(
+                "{:<20}{:>7}{:>8.0%}{:>7.0f}ms{:>9}".format(
+                    name[:19],
+                    calls[name],
+                    errors[name] / calls[name] if calls[name] else 0.0,
+                    histogram.mean * 1000,
+                    "inf" if p99 == float("inf") else f"{p99 * 1000:.0f}ms",
+                )
+            )
+
+        if self.slow:
+            lines.append("")
+            lines.append(f"slower than {self.threshold:g}s, newest first:")
+            for invocation in reversed(self.slow):
+                lines.append(
+                    "{:%H:%M:%S} {} by {}: {:.0f}ms ({})".format(
+                        datetime.utcfromtimestamp(invocation.at),
+                        invocation.command,
+                        invocation.user,
+                        invocation.seconds * 1000,
+                        _breakdown(invocation.timings),
+                    )
+                )
+        return "\n".join(lines)
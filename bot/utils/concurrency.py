@@ -0,0 +1,154 @@
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set, Tuple
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into a single call.
+
+    The call runs as its own task, so a caller being cancelled does not cancel
+    the call for everyone else waiting on it.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: Hashable, fut: asyncio.Future) -> None:
+        if self._calls.get(key) is fut:
+            del self._calls[key]
+        # mark the exception as retrieved in case every waiter went away
+        if not fut.cancelled():
+            fut.exception()
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Await `func()`, or join the call already in flight for `key`."""
+        fut = self._calls.get(key)
+        if fut is None:
+            self.calls += 1
+            fut = asyncio.ensure_future(func())
+            self._calls[key] = fut
+            fut.add_done_callback(lambda f: self._forget(key, f))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(fut)
+
+
+class QueueFull(Exception):
+    """Raised when a scheduler can't take any more jobs."""
+
+
+class FairScheduler:
+    """Run jobs with bounded concurrency and a bounded, per-owner round-robin queue.
+
+    Jobs from one owner never get ahead of the jobs other owners queued,
+    so a single user can't fill every slot with a burst of requests.
+    """
+
+    def __init__(self, name: str, concurrency: int = 4, max_queue: int = 32):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.closed = False
+        self._queues: "OrderedDict[Hashable, Deque[tuple]]" = OrderedDict()
+        self._queued = 0
+        self._running: Set[asyncio.Task] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def _position(self, owner: Hashable) -> int:
+        """Approximate how many queued jobs would run before a new one from `owner`."""
+        own = len(self._queues.get(owner, ()))
+        return own + sum(
+            min(len(queue), own + 1)
+            for other, queue in self._queues.items()
+            if other != owner
+        )
+
+    def submit(
+        self, owner: Hashable, func: Callable[[], Awaitable[Any]]
+    ) -> Tuple[asyncio.Future, int]:
+        """Schedule `func()` and return a future for its result and its queue position.
+
+        A position of 0 means the job started right away.
+        """
+        if self.closed:
+            raise QueueFull(f"The {self.name} queue is shutting down.")
+
+        fut = asyncio.get_event_loop().create_future()
+        if len(self._running) < self.concurrency and not self._queued:
+            self._start(func, fut)
+            return fut, 0
+
+        if self._queued >= self.max_queue:
+            raise QueueFull(f"The {self.name} queue is full, try again later.")
+
+        position = self._position(owner) + 1
+        self._queues.setdefault(owner, deque()).append((func, fut))
+        self._queued += 1
+        return fut, position
+
+    def _start(self, func: Callable[[], Awaitable[Any]], fut: asyncio.Future) -> None:
+        self._idle.clear()
+        task = asyncio.ensure_future(func())
+        self._running.add(task)
+        task.add_done_callback(lambda t: self._finish(t, fut))
+
+    def _finish(self, task: asyncio.Task, fut: asyncio.Future) -> None:
+        self._running.discard(task)
+        if not fut.done():
+            if task.cancelled():
+                fut.cancel()
+            elif task.exception() is not None:
+                fut.set_exception(task.exception())
+            else:
+                fut.set_result(task.result())
+        elif not task.cancelled():
+            task.exception()
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._queues and len(self._running) < self.concurrency:
+            owner, queue = next(iter(self._queues.items()))
+            func, fut = queue.popleft()
+            self._queued -= 1
+            # rotate so the next job comes from another owner
+            del self._queues[owner]
+            if queue:
+                self._queues[owner] = queue
+            if fut.cancelled():
+                continue
+            self._start(func, fut)
+
+        if not self._running and not self._queues:
+            self._idle.set()
+
+    def cancel(self) -> None:
+        """Cancel every queued and running job."""
+        for queue in self._queues.values():
+            for _, fut in queue:
+                fut.cancel()
+        self._queues.clear()
+        self._queued = 0
+        for task in self._running:
+            task.cancel()
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """Stop taking jobs and wait for the queue to drain, cancelling it after `timeout`."""
+        self.closed = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.cancel()
@@ -0,0 +1,178 @@
+"""
+A search index over the AutoHotkey documentation.
+
+The index is built once from a local snapshot of the docs and saved as json:
+
+    python bot/utils/docs_index.py path/to/AutoHotkey/docs -o data/ahk_docs_index.json
+
+Searching checks exact and prefix matches first, then only fuzzy scores the
+few entries sharing the most trigrams with the query.
+"""
+import argparse
+import json
+import re
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+from fuzzywuzzy import fuzz
+
+INDEX_VERSION = 1
+# how many trigram candidates get a full fuzzy score
+CANDIDATES = 25
+
+
+class DocsEntry(NamedTuple):
+    name: str
+    path: str
+    kind: str
+
+
+def _kind(name: str, path: str) -> str:
+    if name.startswith("#"):
+        return "directive"
+    if name.startswith("A_") or path.startswith("Variables.htm"):
+        return "variable"
+    if name.endswith("()"):
+        return "function"
+    return "command"
+
+
+def _normalize(text: str) -> str:
+    return text.lower().strip()
+
+
+def _trigrams(text: str) -> Iterator[str]:
+    text = f"  {text} "
+    return (text[i : i + 3] for i in range(len(text) - 2))
+
+
+class DocsIndex:
+    """Command, function and variable pages of the AutoHotkey docs."""
+
+    def __init__(self, entries: List[DocsEntry], trigrams: Dict[str, List[int]] = None):
+        self.entries = entries
+        self._exact: Dict[str, int] = {}
+        for i, entry in enumerate(entries):
+            self._exact.setdefault(_normalize(entry.name), i)
+        self._sorted: List[Tuple[str, int]] = sorted(
+            (_normalize(e.name), i) for i, e in enumerate(entries)
+        )
+        if trigrams is None:
+            trigrams = {}
+            for i, entry in enumerate(entries):
+                for gram in set(_trigrams(_normalize(entry.name))):
+                    trigrams.setdefault(gram, []).append(i)
+        self._trigrams = trigrams
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[DocsEntry, int]]:
+        """Return up to `limit` entries matching `query` with their scores, best first."""
+        query = _normalize(query)
+        if not query:
+            return []
+
+        scores: Dict[int, int] = {}
+        exact = self._exact.get(query)
+        if exact is not None:
+            scores[exact] = 101
+
+        # names starting with the query
+        start = bisect_left(self._sorted, (query, -1))
+        for name, i in self._sorted[start : start + limit]:
+            if not name.startswith(query):
+                break
+            scores.setdefault(i, 100 - min(len(name) - len(query), 10))
+
+        if len(scores) < limit:
+            shared = Counter()
+            for gram in set(_trigrams(query)):
+                shared.update(self._trigrams.get(gram, ()))
+            for i, _ in shared.most_common(CANDIDATES):
+                if i not in scores:
+                    scores[i] = fuzz.ratio(query, _normalize(self.entries[i].name))
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(self.entries[i], score) for i, score in best]
+
+    def dump(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": INDEX_VERSION,
+                    "entries": [list(e) for e in self.entries],
+                    "trigrams": self._trigrams,
+                },
+                f,
+                separators=(",", ":"),
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "DocsIndex":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"{path} was built by another version, rebuild it.")
+        return cls([DocsEntry(*e) for e in data["entries"]], data["trigrams"])
+
+    @classmethod
+    def build(cls, docs: Path) -> "DocsIndex":
+        """Build the index from a local copy of the docs folder."""
+        data_index = docs / "static" / "source" / "data_index.js"
+        if data_index.exists():
+            pairs = _read_data_index(data_index)
+        else:
+            pairs = _read_pages(docs)
+
+        seen = set()
+        entries = []
+        for name, path in pairs:
+            if (name, path) in seen:
+                continue
+            seen.add((name, path))
+            entries.append(DocsEntry(name, path, _kind(name, path)))
+        return cls(entries)
+
+
+def _read_data_index(path: Path) -> Iterator[Tuple[str, str]]:
+    """Read the index the docs' own search uses: `indexData = [[name, path, ...], ...];`"""
+    text = path.read_text(encoding="utf-8")
+    body = text[text.index("[") : text.rindex("]") + 1]
+    # the file is javascript, not json, and may have trailing commas
+    body = re.sub(r",\s*([\]}])", r"\1", body)
+    for item in json.loads(body):
+        yield item[0], item[1]
+
+
+def _read_pages(docs: Path) -> Iterator[Tuple[str, str]]:
+    """Fall back to the titles of the command pages."""
+    from bs4 import BeautifulSoup
+
+    for page in sorted((docs / "commands").glob("*.htm")):
+        soup = BeautifulSoup(page.read_bytes(), "lxml")
+        title = soup.find("h1") or soup.title
+        if title is None:
+            continue
+        name = title.get_text(" ", strip=True)
+        yield name, page.relative_to(docs).as_posix()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the AutoHotkey docs index.")
+    parser.add_argument("docs", type=Path, help="a local copy of the docs folder")
+    parser.add_argument(
+        "-o", "--output", type=Path, default=Path("data/ahk_docs_index.json")
+    )
+    args = parser.parse_args()
+
+    index = DocsIndex.build(args.docs)
+    index.dump(args.output)
+    print(f"Indexed {len(index)} pages into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
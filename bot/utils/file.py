@@ -1,8 +1,16 @@
+import base64
 import discord
 import io
+import re
+import struct
+from typing import Tuple
 
 DISCORD_UPLOAD_LIMIT = 800000
 
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# base64 of a png always starts with its signature, so it can be found in output
+PNG_BASE64_RE = re.compile(r"iVBORw0KGgo[A-Za-z0-9+/=\s]*\Z")
+
 
 def create_file_obj(
     input: str,
@@ -17,3 +25,36 @@ def create_file_obj(
     fp = io.BytesIO(encoded)
     filename = f"{name}.{ext}"
     return discord.File(fp=fp, filename=filename, spoiler=spoiler)
+
+
+def split_png(text: str) -> Tuple[str, str]:
+    """Split output into the text before a trailing base64 png, and the png."""
+    match = PNG_BASE64_RE.search(text)
+    if match is None:
+        return text, ""
+    return text[: match.start()].rstrip(), "".join(match.group().split())
+
+
+def png_size(header: bytes) -> Tuple[int, int]:
+    """Read the width and height of a png from its first 24 bytes."""
+    if header[:8] != PNG_SIGNATURE or header[12:16] != b"IHDR":
+        raise ValueError("not a png")
+    return struct.unpack(">II", header[16:24])
+
+
+def decode_png(
+    data: str, max_pixels: int, max_bytes: int = DISCORD_UPLOAD_LIMIT
+) -> bytes:
+    """Decode a base64 png, checking its size before decoding all of it.
+
+    This does the CPU heavy part, so run it in an executor.
+    """
+    if not data:
+        raise ValueError("no png in the output")
+    # every 4 characters of base64 hold 3 bytes
+    if len(data) // 4 * 3 > max_bytes:
+        raise ValueError("image is too large to upload")
+    width, height = png_size(base64.b64decode(data[:32]))
+    if width * height > max_pixels:
+        raise ValueError(f"image is too large ({width}x{height})")
+    return base64.b64decode(data, validate=True)
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+import pygit2
+import verboselogs
+
+log: verboselogs.VerboseLogger = logging.getLogger(__name__)
+
+
+class GitState:
+    """The branch and commit the bot is running from.
+
+    Resolved once, then re-resolved in the background only when the mtime of
+    HEAD or the refs changes, so reading it never touches the disk.
+    """
+
+    def __init__(self, path: str = ".git", interval: float = 10.0):
+        self.path = Path(path)
+        self.interval = interval
+        # None while HEAD is detached
+        self.branch: Optional[str] = None
+        self.commit: Optional[str] = None
+        self._mtimes: Tuple[float, ...] = ()
+        self._task: Optional[asyncio.Task] = None
+        self.refresh()
+
+    @property
+    def ref(self) -> Optional[str]:
+        """What to link to on GitHub: the branch, or the commit if detached."""
+        return self.branch or self.commit
+
+    def _watched(self) -> Tuple[float, ...]:
+        mtimes = []
+        for name in ("HEAD", "packed-refs", f"refs/heads/{self.branch}"):
+            try:
+                mtimes.append(os.stat(self.path / name).st_mtime)
+            except OSError:
+                mtimes.append(0.0)
+        return tuple(mtimes)
+
+    def refresh(self) -> bool:
+        """Re-resolve HEAD if it may have moved. Returns whether it was."""
+        mtimes = self._watched()
+        if mtimes == self._mtimes:
+            return False
+        try:
+            repo = pygit2.Repository(str(self.path))
+            head = repo.head
+        except (pygit2.GitError, KeyError) as e:
+            log.warning("Couldn't resolve the git HEAD: %r", e)
+            self.branch = self.commit = None
+        else:
+            self.branch = None if repo.head_is_detached else head.shorthand
+            self.commit = str(head.target)
+        # the watched branch file may have changed with the branch
+        self._mtimes = self._watched()
+        log.debug("git HEAD is %s (%s)", self.branch, self.commit)
+        return True
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._refresh_loop())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _refresh_loop(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            await loop.run_in_executor(None, self.refresh)
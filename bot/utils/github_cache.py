@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+import verboselogs
+from discord.ext import commands
+from utils.cache import LRUCache
+
+log: verboselogs.VerboseLogger = logging.getLogger(__name__)
+
+
+class GithubCache:
+    """A disk backed cache of GitHub API responses, revalidated with their ETag.
+
+    A 304 doesn't count against the rate limit, so revalidating is cheap.
+    Once the limit runs out, stored responses are served as they are until
+    it resets, instead of failing.
+    """
+
+    def __init__(self, directory: str, maxsize: int = 128):
+        self.directory = Path(directory)
+        self.memory = LRUCache(maxsize)
+        # from the X-RateLimit headers of the last response
+        self.remaining: Optional[int] = None
+        self.reset: Optional[float] = None
+        self.requests = 0
+        self.revalidated = 0
+        self.stale = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
+
+    def _read(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key: str, entry: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self._path(key), "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+
+    async def _entry(self, key: str) -> Optional[dict]:
+        entry = self.memory.get(key)
+        if entry is None:
+            loop = asyncio.get_event_loop()
+            entry = await loop.run_in_executor(None, self._read, key)
+            if entry is not None:
+                self.memory.set(key, entry)
+        return entry
+
+    @property
+    def limited(self) -> bool:
+        return (
+            self.remaining == 0 and self.reset is not None and time.time() < self.reset
+        )
+
+    def _update_limit(self, resp: aiohttp.ClientResponse) -> None:
+        remaining = resp.headers.get("X-RateLimit-Remaining")
+        if remaining is not None:
+            self.remaining = int(remaining)
+            self.reset = float(resp.headers.get("X-RateLimit-Reset", 0))
+
+    async def get(
+        self, session: aiohttp.ClientSession, path: str, ref: str = None
+    ) -> Optional[dict]:
+        """Get the json at `path` of the GitHub API, or None if it doesn't exist."""
+        params = {"ref": ref} if ref else {}
+        key = f"{path}@{ref or ''}"
+        entry = await self._entry(key)
+
+        if self.limited:
+            if entry is not None:
+                self.stale += 1
+                return entry["body"]
+            raise commands.CommandError(
+                "GitHub rate limit reached, try again in "
+                f"{self.reset - time.time():.0f} seconds."
+            )
+
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+
+        self.requests += 1
+        async with session.get(path, params=params, headers=headers) as resp:
+            self._update_limit(resp)
+            if resp.status == 304 and entry is not None:
+                self.revalidated += 1
+                return entry["body"]
+            if resp.status == 404:
+                return None
+            if resp.status != 200:
+                if entry is not None and self.limited:
+                    self.stale += 1
+                    return entry["body"]
+                raise commands.CommandError(f"GitHub returned {resp.status}.")
+            body = await resp.json()
+            etag = resp.headers.get("ETag")
+
+        entry = {"etag": etag, "body": body}
+        self.memory.set(key, entry)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._write, key, entry)
+        return body
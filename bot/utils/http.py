@@ -0,0 +1,25 @@
+from typing import Tuple
+
+import aiohttp
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def read_capped(resp: aiohttp.ClientResponse, limit: int) -> Tuple[bytes, bool]:
+    """Read at most `limit` bytes of a response body.
+
+    Returns the body and whether it was cut short. A cut short response is
+    closed straight away, so the rest of it is never downloaded.
+    """
+    if resp.content_length is not None and resp.content_length <= limit:
+        return await resp.read(), False
+
+    buf = bytearray()
+    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+        remaining = limit - len(buf)
+        if len(chunk) > remaining:
+            buf += chunk[:remaining]
+            resp.close()
+            return bytes(buf), True
+        buf += chunk
+    return bytes(buf), False
@@ -0,0 +1,47 @@
+import sys
+from datetime import datetime
+from itertools import islice
+from typing import Any, Collection, Iterable, Tuple
+
+_PRIMITIVES = (str, bytes, int, float, bool, type(None), datetime)
+
+
+def _value_size(value: Any) -> int:
+    if isinstance(value, _PRIMITIVES):
+        return sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(
+            sys.getsizeof(v) for v in value if isinstance(v, _PRIMITIVES)
+        )
+    if isinstance(value, dict):
+        return sys.getsizeof(value)
+    # other models are counted in their own cache
+    return 0
+
+
+def shallow_size(obj: Any) -> int:
+    """The size of `obj` and the plain values it holds, without following other objects."""
+    size = sys.getsizeof(obj)
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get("__slots__", ()):
+            size += _value_size(getattr(obj, name, None))
+    for value in getattr(obj, "__dict__", {}).values():
+        size += _value_size(value)
+    return size
+
+
+def estimate_size(objects: Iterable[Any], count: int, sample: int = 200) -> int:
+    """Estimate the size of `count` objects from the first `sample` of them."""
+    sizes = [shallow_size(obj) for obj in islice(objects, sample)]
+    if not sizes:
+        return 0
+    return sum(sizes) * count // len(sizes)
+
+
+def cache_report(caches: Iterable[Tuple[str, Collection]]) -> str:
+    """Format (name, objects) pairs as a table of counts and approximate sizes."""
+    lines = [f"{'cache':<10}{'count':>9}{'approx':>11}"]
+    for name, objects in caches:
+        size = estimate_size(iter(objects), len(objects))
+        lines.append(f"{name:<10}{len(objects):>9}{size / 1024:>8.0f}KiB")
+    return "\n".join(lines)
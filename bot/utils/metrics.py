@@ -0,0 +1,339 @@
+import logging
+import random
+import re
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+import aiohttp
+import verboselogs
+
+log: verboselogs.VerboseLogger = logging.getLogger(__name__)
+# sampled requests are logged here, where every request used to be
+trace_log: verboselogs.VerboseLogger = logging.getLogger("aiotrace")
+
+# seconds; the last bucket catches everything slower
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    float("inf"),
+)
+
+# path segments that are ids rather than part of the route
+ID_SEGMENT_RE = re.compile(r"^(?:\d+|[0-9a-f]{16,})$", re.IGNORECASE)
+
+
+class Histogram:
+    """Counts of observations in fixed buckets, so it never grows."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, pct: float) -> float:
+        """The upper bound of the bucket holding the `pct`th percentile."""
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+def route_of(method: str, url) -> Tuple[str, str]:
+    """The host and `METHOD /path` of a request, with ids in the path replaced."""
+    segments = [
+        ":id" if ID_SEGMENT_RE.match(segment) else segment
+        for segment in url.path.split("/")
+    ]
+    return url.host or "", f"{method.upper()} {'/'.join(segments)}"
+
+
+class HttpMetrics:
+    """Counters and latency histograms for every request made with aiohttp.
+
+    Filled from the signals of the `TraceConfig` it makes, which every
+    session of the bot shares.
+    """
+
+    def __init__(self, log_sample: float = 0.0, max_routes: int = 256):
+        # the fraction of requests logged, as every request once was
+        self.log_sample = log_sample
+        self.max_routes = max_routes
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        # (host, status) -> count
+        self.statuses: Counter = Counter()
+        self.hosts: Dict[str, Histogram] = {}
+        # (host, route) -> latency
+        self.routes: Dict[Tuple[str, str], Histogram] = {}
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_cache_hits = 0
+        self.dns = Histogram()
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        trace_config.on_connection_create_end.append(self._on_connection_create)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuse)
+        trace_config.on_dns_resolvehost_start.append(self._on_dns_start)
+        trace_config.on_dns_resolvehost_end.append(self._on_dns_end)
+        trace_config.on_dns_cache_hit.append(self._on_dns_cache_hit)
+        return trace_config
+
+    def _route_histogram(self, key: Tuple[str, str]) -> Histogram:
+        histogram = self.routes.get(key)
+        if histogram is None:
+            if len(self.routes) >= self.max_routes:
+                key = (key[0], "other")
+            histogram = self.routes.setdefault(key, Histogram())
+        return histogram
+
+    async def _on_request_start(self, session, ctx, params) -> None:
+        ctx.start = time.perf_counter()
+
+    async def _on_request_end(self, session, ctx, params) -> None:
+        elapsed = time.perf_counter() - ctx.start
+        host, route = route_of(params.method, params.url)
+        status = params.response.status
+        self.requests[host] += 1
+        self.statuses[host, status] += 1
+        self.hosts.setdefault(host, Histogram()).observe(elapsed)
+        self._route_histogram((host, route)).observe(elapsed)
+        if self.log_sample and random.random() < self.log_sample:
+            trace_log.info("[%d] %s %s (%.0fms)", status, route, host, elapsed * 1000)
+
+    async def _on_request_exception(self, session, ctx, params) -> None:
+        host = params.url.host or ""
+        self.requests[host] += 1
+        self.errors[host] += 1
+
+    async def _on_connection_create(self, session, ctx, params) -> None:
+        self.connections_created += 1
+
+    async def _on_connection_reuse(self, session, ctx, params) -> None:
+        self.connections_reused += 1
+
+    async def _on_dns_start(self, session, ctx, params) -> None:
+        ctx.dns_start = time.perf_counter()
+
+    async def _on_dns_end(self, session, ctx, params) -> None:
+        self.dns.observe(time.perf_counter() - ctx.dns_start)
+
+    async def _on_dns_cache_hit(self, session, ctx, params) -> None:
+        self.dns_cache_hits += 1
+
+    def register(self, registry: "Registry") -> None:
+        """Expose these metrics through `registry`."""
+        registry.collect(
+            "http_client_responses_total",
+            "Outgoing http requests answered, by host and status.",
+            "counter",
+            lambda: (
+                ((("host", host), ("status", status)), count)
+                for (host, status), count in self.statuses.items()
+            ),
+        )
+        registry.collect(
+            "http_client_errors_total",
+            "Outgoing http requests that failed without a response, by host.",
+            "counter",
+            lambda: (((("host", host),), count) for host, count in self.errors.items()),
+        )
+        registry.collect(
+            "http_client_request_seconds",
+            "Outgoing http request latency, by host.",
+            "histogram",
+            lambda: (((("host", host),), h) for host, h in self.hosts.items()),
+        )
+        registry.collect(
+            "http_client_connections_total",
+            "Connections opened and reused by the http client.",
+            "counter",
+            lambda: (
+                ((("state", "opened"),), self.connections_created),
+                ((("state", "reused"),), self.connections_reused),
+            ),
+        )
+        registry.collect(
+            "http_client_dns_seconds",
+            "DNS lookups made by the http client.",
+            "histogram",
+            lambda: (((), self.dns),),
+        )
+
+    def report(self, routes: int = 10) -> str:
+        lines: List[str] = [
+            f"{'host':<28}{'reqs':>7}{'errs':>6}{'p50':>8}{'p99':>8}  statuses"
+        ]
+        for host, histogram in sorted(
+            self.hosts.items(), key=lambda item: self.requests[item[0]], reverse=True
+        ):
+            statuses = " ".join(
+                f"{status}:{count}"
+                for (h, status), count in sorted(self.statuses.items())
+                if h == host
+            )
+            lines.append(
+                f"{host[:27]:<28}{self.requests[host]:>7}{self.errors[host]:>6}"
+                f"{_ms(histogram.percentile(50)):>8}{_ms(histogram.percentile(99)):>8}"
+                f"  {statuses}"
+            )
+
+        lines.append("")
+        lines.append(f"{'route':<49}{'reqs':>7}{'mean':>8}{'p99':>8}")
+        busiest = sorted(self.routes.items(), key=lambda r: r[1].count, reverse=True)
+        for (host, route), histogram in busiest[:routes]:
+            name = f"{host} {route}"
+            lines.append(
+                f"{name[:48]:<49}{histogram.count:>7}"
+                f"{_ms(histogram.mean):>8}{_ms(histogram.percentile(99)):>8}"
+            )
+
+        connections = self.connections_created + self.connections_reused
+        reuse = self.connections_reused / connections if connections else 0.0
+        lines.append("")
+        lines.append(
+            f"connections: {self.connections_created} opened, "
+            f"{self.connections_reused} reused ({reuse:.0%})"
+        )
+        lines.append(
+            f"dns: {self.dns.count} lookups (p50 {_ms(self.dns.percentile(50))}), "
+            f"{self.dns_cache_hits} cache hits"
+        )
+        return "\n".join(lines)
+
+
+def _ms(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "inf"
+    return f"{seconds * 1000:.0f}ms"
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Labels, extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for key, value in labels
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Counters, histograms and gauges, rendered in the Prometheus text format.
+
+    Updating a counter or histogram is a dict lookup and an addition, so they
+    are fine to update in hot paths. Collected metrics are callbacks, read only
+    when the metrics are rendered.
+    """
+
+    def __init__(self):
+        self.help: Dict[str, str] = {}
+        self.counters: Dict[str, Counter] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        # name -> (type, callback yielding (labels, value or Histogram))
+        self.collected: Dict[str, Tuple[str, Callable[[], Iterable[tuple]]]] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        self.help[name] = help
+        return self.counters.setdefault(name, Counter())
+
+    def histogram(self, name: str, help: str) -> Dict[Labels, Histogram]:
+        self.help[name] = help
+        return self.histograms.setdefault(name, {})
+
+    def collect(
+        self, name: str, help: str, kind: str, read: Callable[[], Iterable[tuple]]
+    ) -> None:
+        """Read a `kind` of metric from `read` whenever the metrics are rendered."""
+        self.help[name] = help
+        self.collected[name] = (kind, read)
+
+    def gauge(self, name: str, help: str, read: Callable[[], Iterable[tuple]]) -> None:
+        self.collect(name, help, "gauge", read)
+
+    def remove(self, name: str) -> None:
+        for metrics in (self.help, self.counters, self.histograms, self.collected):
+            metrics.pop(name, None)
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1) -> None:
+        self.counters[name][labels] += value
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        histograms = self.histograms[name]
+        histogram = histograms.get(labels)
+        if histogram is None:
+            histogram = histograms[labels] = Histogram()
+        histogram.observe(value)
+
+    def _render(self, lines: List[str], name: str, kind: str, values) -> None:
+        lines.append(f"# HELP {name} {self.help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in values:
+            if not isinstance(value, Histogram):
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(value.buckets, value.counts):
+                cumulative += count
+                le = 'le="{}"'.format(_number(bound))
+                lines.append(f"{name}_bucket{_labels(labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(value.sum)}")
+            lines.append(f"{name}_count{_labels(labels)} {value.count}")
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, counter in self.counters.items():
+            self._render(lines, name, "counter", counter.items())
+        for name, histograms in self.histograms.items():
+            self._render(lines, name, "histogram", histograms.items())
+        for name, (kind, read) in self.collected.items():
+            try:
+                values = list(read())
+            except Exception:
+                log.exception("Collecting metric %s failed", name)
+                continue
+            self._render(lines, name, kind, values)
+        return "\n".join(lines) + "\n"
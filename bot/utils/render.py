@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import re
+from bisect import bisect_left
+from contextlib import suppress
+from typing import List, Sequence, Tuple
+
+import discord
+import verboselogs
+from constants import MESSAGE_LIMIT
+from discord.ext import commands
+from utils.file import create_file_obj
+
+log: verboselogs.VerboseLogger = logging.getLogger(__name__)
+
+# one pass finds every line break and every code fence in the output
+SCAN_RE = re.compile(r"\r\n|\r|\n|```")
+FENCE = "```"
+ESCAPED_FENCE = "`\u200b``"
+
+PAGE_EMOJI = {
+    "\N{BLACK LEFT-POINTING TRIANGLE}": -1,
+    "\N{BLACK RIGHT-POINTING TRIANGLE}": 1,
+    "\N{BLACK SQUARE FOR STOP}": None,
+}
+
+
+class OutputRenderer:
+    """Decide how to show command output, and render it one page at a time.
+
+    The output is scanned once for line breaks and code fences. Inline and
+    paginated output only keep page offsets around; the text of a page is
+    sliced out and escaped when that page is shown.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        language: str = "",
+        *,
+        budget: int = 1800,
+        page_lines: int = 20,
+        max_pages: int = 20,
+        paginate: bool = True,
+    ):
+        self.text = text
+        self.language = language
+        self.budget = budget
+        self.page_lines = page_lines
+        self.pages: List[Tuple[int, int]] = []
+
+        if not text:
+            self.mode = "empty"
+        elif len(text) > budget * max_pages:
+            # too long to page through, no need to look any closer
+            self.mode = "attachment"
+        else:
+            breaks, self._fences = self._scan(text)
+            self.pages = self._paginate(breaks)
+            if len(self.pages) == 1:
+                self.mode = "inline"
+            elif paginate and len(self.pages) <= max_pages:
+                self.mode = "paginated"
+            else:
+                self.mode = "attachment"
+
+    @staticmethod
+    def _scan(text: str) -> Tuple[List[int], List[int]]:
+        """Return the offsets just past each line break, and the offsets of each fence."""
+        breaks = []
+        fences = []
+        for match in SCAN_RE.finditer(text):
+            if match.group() == FENCE:
+                fences.append(match.start())
+            else:
+                breaks.append(match.end())
+        breaks.append(len(text))
+        return breaks, fences
+
+    def _rendered_len(self, start: int, end: int) -> int:
+        """Length of text[start:end] once its fences are escaped."""
+        fences = bisect_left(self._fences, end - 2) - bisect_left(self._fences, start)
+        return end - start + fences
+
+    def _paginate(self, breaks: Sequence[int]) -> List[Tuple[int, int]]:
+        pages = []
+        start = 0
+        lines = 0
+        prev = 0
+        for end in breaks:
+            if end == prev:
+                continue
+            if lines and (
+                lines >= self.page_lines or self._rendered_len(start, end) > self.budget
+            ):
+                pages.append((start, prev))
+                start = prev
+                lines = 0
+            # a single line too long for a page gets split wherever it has to be
+            while self._rendered_len(start, end) > self.budget:
+                # escaping can grow text by a third at most
+                cut = start + self.budget * 3 // 4
+                pages.append((start, cut))
+                start = cut
+            lines += 1
+            prev = end
+        if start < prev:
+            pages.append((start, prev))
+        return pages
+
+    def page(self, index: int) -> str:
+        """Render one page as a code block."""
+        start, end = self.pages[index]
+        body = self.text[start:end].rstrip("\r\n").replace(FENCE, ESCAPED_FENCE)
+        return f"```{self.language}\n{body}\n```"
+
+    def file(self, filename: str = "results.txt") -> discord.File:
+        name, _, ext = filename.rpartition(".")
+        return create_file_obj(self.text, name=name, ext=ext)
+
+
+async def send_output(
+    ctx: commands.Context,
+    text: str,
+    *,
+    prefix: str = "",
+    suffix: str = "",
+    language: str = "",
+    filename: str = "results.txt",
+    empty: str = "`No Output.`",
+    attached: str = "Results too large. See attached file(s).",
+    files: Sequence[discord.File] = (),
+    timeout: float = 120.0,
+    **kwargs,
+) -> discord.Message:
+    """Send `text` between `prefix` and `suffix` inline, as pages, or as an attachment.
+
+    Pages are flipped with reactions by the invoking user until `timeout`
+    passes without any. Extra keyword arguments go to `ctx.send`.
+    """
+    # room for the code fence, language and the page counter
+    budget = min(1800, MESSAGE_LIMIT - len(prefix) - len(suffix) - len(language) - 32)
+    perms = ctx.channel.permissions_for(ctx.me)
+    renderer = OutputRenderer(
+        text,
+        language,
+        budget=max(budget, 200),
+        paginate=perms.add_reactions and perms.read_message_history,
+    )
+    files = list(files)
+
+    if renderer.mode == "empty":
+        return await ctx.send(prefix + empty + suffix, files=files or None, **kwargs)
+    if renderer.mode == "inline":
+        return await ctx.send(
+            prefix + renderer.page(0) + suffix, files=files or None, **kwargs
+        )
+    if renderer.mode == "attachment":
+        files.insert(0, renderer.file(filename))
+        return await ctx.send(prefix + attached + suffix, files=files, **kwargs)
+
+    def content(index: int) -> str:
+        return "{}{}\n`Page {}/{}`{}".format(
+            prefix, renderer.page(index), index + 1, len(renderer.pages), suffix
+        )
+
+    message = await ctx.send(content(0), files=files or None, **kwargs)
+    ctx.bot.loop.create_task(_paginate(ctx, message, renderer, content, timeout))
+    return message
+
+
+async def _paginate(ctx, message, renderer, content, timeout) -> None:
+    """Flip `message` through the pages of `renderer` as its author reacts."""
+    with suppress(discord.HTTPException):
+        for emoji in PAGE_EMOJI:
+            await message.add_reaction(emoji)
+
+    def check(reaction: discord.Reaction, user: discord.abc.User) -> bool:
+        return (
+            reaction.message.id == message.id
+            and user.id == ctx.author.id
+            and str(reaction.emoji) in PAGE_EMOJI
+        )
+
+    index = 0
+    while True:
+        try:
+            reaction, user = await ctx.bot.wait_for(
+                "reaction_add", check=check, timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            break
+        step = PAGE_EMOJI[str(reaction.emoji)]
+        if step is None:
+            break
+        with suppress(discord.HTTPException):
+            await message.remove_reaction(reaction.emoji, user)
+        new_index = max(0, min(len(renderer.pages) - 1, index + step))
+        if new_index != index:
+            index = new_index
+            with suppress(discord.HTTPException):
+                await message.edit(content=content(index))
+
+    with suppress(discord.HTTPException):
+        await message.clear_reactions()
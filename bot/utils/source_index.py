@@ -0,0 +1,69 @@
+import inspect
+import linecache
+import logging
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+import verboselogs
+from discord.ext import commands
+
+log: verboselogs.VerboseLogger = logging.getLogger(__name__)
+
+
+class SourceEntry(NamedTuple):
+    # relative to the repository root, which is where the bot is run from
+    path: str
+    start: int
+    end: int
+    docstring: Optional[str]
+
+
+class SourceIndex:
+    """Where each command is defined, read from the loaded code itself.
+
+    Built per extension as it is loaded, so `=source` never has to fetch or
+    parse a file to answer.
+    """
+
+    def __init__(self):
+        self._extensions: Dict[str, Dict[str, SourceEntry]] = {}
+        self._commands: Dict[str, SourceEntry] = {}
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def get(self, qualified_name: str) -> Optional[SourceEntry]:
+        return self._commands.get(qualified_name)
+
+    def index(self, bot: commands.Bot, extension: str) -> None:
+        """(Re)index the commands defined in `extension`."""
+        self.drop(extension)
+        entries = {}
+        for command in bot.walk_commands():
+            callback = command.callback
+            if callback.__module__ != extension:
+                continue
+            try:
+                entries[command.qualified_name] = self._entry(callback)
+            except (OSError, TypeError, ValueError) as e:
+                log.warning("Couldn't index %s: %r", command.qualified_name, e)
+        self._extensions[extension] = entries
+        self._commands.update(entries)
+        log.debug("Indexed %d commands from %s", len(entries), extension)
+
+    def drop(self, extension: str) -> None:
+        for name in self._extensions.pop(extension, {}):
+            self._commands.pop(name, None)
+
+    @staticmethod
+    def _entry(callback) -> SourceEntry:
+        file = inspect.getsourcefile(callback)
+        # a reloaded file must not be read from the old cached lines
+        linecache.checkcache(file)
+        lines, start = inspect.getsourcelines(callback)
+        return SourceEntry(
+            Path(file).relative_to(Path.cwd()).as_posix(),
+            start,
+            start + len(lines) - 1,
+            inspect.getdoc(callback),
+        )
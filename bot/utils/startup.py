@@ -0,0 +1,53 @@
+import time
+from typing import Dict, List, Optional
+
+
+class StartupProfile:
+    """How long each part of starting the bot took.
+
+    Times are seconds, and marks are seconds since the profile was created,
+    which is when the bot was.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # extension -> {"import": seconds, "setup": seconds}
+        self.extensions: Dict[str, Dict[str, float]] = {}
+        self.failed: Dict[str, str] = {}
+        # cog -> seconds its deferred setup took
+        self.deferred: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, name: str) -> None:
+        """Note when `name` happened, the first time it does."""
+        self.marks.setdefault(name, time.perf_counter() - self.started)
+
+    def since(self, name: str, until: str) -> Optional[float]:
+        if name not in self.marks or until not in self.marks:
+            return None
+        return self.marks[until] - self.marks[name]
+
+    def report(self) -> str:
+        lines: List[str] = [f"{'extension':<24}{'import':>9}{'setup':>9}"]
+        for name, timing in self.extensions.items():
+            lines.append(
+                "{:<24}{:>7.0f}ms{:>7.0f}ms".format(
+                    name, timing["import"] * 1000, timing["setup"] * 1000
+                )
+            )
+        for name, error in self.failed.items():
+            lines.append(f"{name:<24} failed: {error}")
+
+        if self.deferred:
+            lines.append("")
+            lines.append(f"{'deferred setup':<24}{'':>9}{'time':>9}")
+            for name, seconds in self.deferred.items():
+                lines.append(f"{name:<24}{'':>9}{seconds * 1000:>7.0f}ms")
+
+        lines.append("")
+        for name, at in self.marks.items():
+            lines.append(f"{name:<24}{'at':>9}{at:>8.2f}s")
+        gateway = self.since("connect", "ready")
+        if gateway is not None:
+            lines.append(f"{'gateway connection':<24}{'took':>9}{gateway:>8.2f}s")
+        return "\n".join(lines)
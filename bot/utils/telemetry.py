@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import aiohttp
+import discord
+import verboselogs
+from discord.ext import commands
+from utils.metrics import Histogram
+
+log: verboselogs.VerboseLogger = logging.getLogger(__name__)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    index = min(len(samples) - 1, max(0, round(pct / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+class RingBuffer:
+    """The last `maxlen` timestamped samples of something."""
+
+    def __init__(self, maxlen: int):
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=maxlen)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, value: float) -> None:
+        self._samples.append((time.time(), value))
+
+    @property
+    def last(self) -> Optional[float]:
+        return self._samples[-1][1] if self._samples else None
+
+    def values(self, since: float = 0.0) -> List[float]:
+        return [value for ts, value in self._samples if ts >= since]
+
+    def percentile(self, pct: float, since: float = 0.0) -> float:
+        return percentile(self.values(since), pct)
+
+
+# seconds the event loop was late waking up a sleeping task
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, float("inf"))
+
+
+class LatencyMonitor:
+    """Samples shard heartbeat latency, the REST round trip and event loop lag."""
+
+    def __init__(
+        self,
+        bot: commands.AutoShardedBot,
+        interval: float = 30,
+        size: int = 120,
+        lag_interval: float = 1,
+    ):
+        self.bot = bot
+        self.interval = interval
+        self.size = size
+        self.lag_interval = lag_interval
+        self.shards: Dict[int, RingBuffer] = {}
+        self.rest = RingBuffer(size)
+        # kept apart from the samples, so pinging often can't shorten their window
+        self.pings = RingBuffer(size)
+        self.loop_lag = Histogram(LAG_BUCKETS)
+        self.last_loop_lag = 0.0
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        loops = (self._sample_loop, self._lag_loop)
+        if not self._tasks:
+            self._tasks = [asyncio.ensure_future(loop()) for loop in loops]
+            return
+        # a loop that died is started again, the others keep running
+        self._tasks = [
+            asyncio.ensure_future(loop()) if task.done() else task
+            for task, loop in zip(self._tasks, loops)
+        ]
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def record_ping(self, seconds: float) -> None:
+        self.pings.add(seconds)
+
+    async def sample(self) -> None:
+        for shard_id, latency in self.bot.latencies:
+            # a shard has no latency until its first heartbeat is acknowledged
+            if math.isfinite(latency):
+                self.shards.setdefault(shard_id, RingBuffer(self.size)).add(latency)
+
+        start = time.perf_counter()
+        try:
+            await self.bot.http.get_gateway()
+        except (
+            discord.HTTPException,
+            aiohttp.ClientError,
+            OSError,
+            asyncio.TimeoutError,
+        ) as e:
+            log.warning("Sampling the REST latency failed: %r", e)
+        else:
+            self.rest.add(time.perf_counter() - start)
+
+    async def _sample_loop(self) -> None:
+        while True:
+            await self.sample()
+            await asyncio.sleep(self.interval)
+
+    async def _lag_loop(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            self.last_loop_lag = max(0.0, loop.time() - expected)
+            self.loop_lag.observe(self.last_loop_lag)
+
+    def worst_shard(self, since: float = 0.0) -> Optional[Tuple[int, float]]:
+        """The shard with the highest p99 heartbeat latency, and that p99."""
+        worst = None
+        for shard_id, samples in self.shards.items():
+            p99 = samples.percentile(99, since)
+            if worst is None or p99 > worst[1]:
+                worst = shard_id, p99
+        return worst